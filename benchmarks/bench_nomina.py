@@ -0,0 +1,182 @@
+"""Benchmark reproducible de carga, búsqueda individual y búsqueda masiva.
+
+Uso:
+    python benchmarks/bench_nomina.py --filas 100000 --salida bench_100k.json
+    python benchmarks/bench_nomina.py --filas 100000 --comparar bench_100k.json
+    python benchmarks/bench_nomina.py --filas 1000000 --criterios 10000 -w 1 2 4 8
+
+Genera (o reutiliza) libros sintéticos con `generar_libros.py` en `--carpeta`, mide cada fase
+con `time.perf_counter` (mediana de `--repeticiones`) y, en una corrida aparte con
+`tracemalloc`, el pico de memoria. El resultado se guarda en JSON para compararlo con el de
+otra versión del código. Con `--trabajadores` se mide además la búsqueda masiva con la
+plantilla más grande repartida en esos números de procesos y su aceleración respecto al primero;
+las corridas que el motor hizo en serie (menos de MIN_FILAS_PARALELO filas) se marcan como tales.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import motor_nomina  # noqa: E402
+from generar_libros import generar_libros  # noqa: E402
+
+def medir(funcion, repeticiones=3, memoria=True):
+    """Mediana de tiempo de pared (s) y pico de memoria (MB) de `funcion()`."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    return {"segundos": statistics.median(tiempos), "min_segundos": min(tiempos), "pico_mb": pico}
+
+def plantilla_masiva(conjunto, n, semilla=7):
+    """Plantilla de `n` filas con RFC reales del histórico (y algunas con NOMBRE) más RFC inexistentes."""
+    hojas = [df for hojas in conjunto["libros"].values() for df in hojas.values() if "RFC" in df.columns]
+    rfcs = pd.concat([df[["RFC", "NOMBRE"]] for df in hojas]).drop_duplicates("RFC")
+    # Con más filas que RFC distintos se repiten RFC para que la plantilla tenga las `n` filas
+    muestra = rfcs.sample(n=n, random_state=semilla, replace=n > len(rfcs)).reset_index(drop=True)
+    plantilla = pd.DataFrame({"RFC": muestra["RFC"].astype(str), "NOMBRE": "", "ADSCRIPCION": "",
+                              "CUENTA": "", "OFICIO ELABORADO": "", "ASUNTO": ""})
+    con_nombre = plantilla.index % 5 == 0
+    plantilla.loc[con_nombre, "NOMBRE"] = muestra.loc[con_nombre, "NOMBRE"].astype(str)
+    plantilla.loc[plantilla.index % 10 == 3, "RFC"] = "XXXX000000000"
+    return plantilla
+
+def correr(args):
+    carpeta = args.carpeta or os.path.join("bench_datos", f"{args.filas}")
+    if args.regenerar and os.path.isdir(carpeta):
+        shutil.rmtree(carpeta)
+    if not all(os.path.exists(r) for r in motor_nomina.rutas_libros(carpeta).values()):
+        print(f"Generando {args.filas} filas sintéticas en {carpeta} ...")
+        generar_libros(carpeta, args.filas, args.semilla)
+
+    resultados = {}
+    cache = os.path.join(carpeta, ".cache_columnar")
+
+    def carga_fria():
+        shutil.rmtree(cache, ignore_errors=True)
+        motor_nomina.construir_conjunto(carpeta, max_procesos=args.procesos)
+
+    resultados["carga_sin_cache"] = medir(carga_fria, 1, memoria=not args.sin_memoria)
+    resultados["carga_con_cache"] = medir(lambda: motor_nomina.construir_conjunto(carpeta, max_procesos=args.procesos),
+                                          args.repeticiones, memoria=not args.sin_memoria)
+    conjunto = motor_nomina.construir_conjunto(carpeta, max_procesos=args.procesos)
+    filas_totales = sum(len(df) for hojas in conjunto["libros"].values() for df in hojas.values())
+
+    ejemplo = conjunto["libros"]["HISTORICO"][next(iter(conjunto["libros"]["HISTORICO"]))].iloc[0]
+    consultas = {
+        "individual_rfc": ({"RFC": str(ejemplo["RFC"])}, {}),
+        "individual_apellido": ({"NOMBRE": str(ejemplo["NOMBRE"]).split()[0]}, {}),
+        "individual_nombre_y_adscripcion": ({"NOMBRE": str(ejemplo["NOMBRE"])[:8],
+                                             "ADSCRIPCION": str(ejemplo["ADSCRIPCION"])[-6:]}, {}),
+        "individual_columna_valor": ({}, {"columna_especifica": "CODIGO", "valor_especifico": str(ejemplo["CODIGO"])}),
+    }
+    for nombre, (valores, extra) in consultas.items():
+        resultados[nombre] = medir(lambda: motor_nomina.buscar_datos_todos_libros(
+            conjunto["libros"], valores, normalizados=conjunto["normalizados"], indices=conjunto["indices"],
+            plan=conjunto["plan"], **extra),
+            args.repeticiones, memoria=not args.sin_memoria)
+
+    for n in args.criterios:
+        plantilla = plantilla_masiva(conjunto, n, args.semilla)
+        resultados[f"masiva_{n}"] = medir(lambda: motor_nomina.buscar_masivo_todos_libros(
+            conjunto["libros"], plantilla, normalizados=conjunto["normalizados"], plan=conjunto["plan"]),
+            args.repeticiones, memoria=not args.sin_memoria)
+
+    # Aceleración del cruce masivo en paralelo con la plantilla más grande. tracemalloc no ve
+    # la memoria de los procesos del pool, así que aquí solo se mide el tiempo.
+    # Con menos de MIN_FILAS_PARALELO filas el motor cruza en serie aunque se pidan procesos.
+    n = max(args.criterios)
+    plantilla = plantilla_masiva(conjunto, n, args.semilla)
+    if filas_totales < motor_nomina.MIN_FILAS_PARALELO and max(args.trabajadores) > 1:
+        print(f"Aviso: con {filas_totales:,} filas (menos de {motor_nomina.MIN_FILAS_PARALELO:,}) el cruce "
+              "masivo se hace en serie; -w no cambia nada.")
+    base = None
+    for trabajadores in args.trabajadores:
+        def masiva_paralela(medicion=None):
+            return motor_nomina.buscar_masivo_todos_libros(
+                conjunto["libros"], plantilla, normalizados=conjunto["normalizados"], plan=conjunto["plan"],
+                procesos=trabajadores, huellas=conjunto["huellas"], carpeta=carpeta, medicion=medicion)
+        # Escribe las particiones Arrow antes de medir y registra cuántos procesos se usaron de verdad
+        medicion = motor_nomina.nueva_medicion("busqueda_masiva")
+        masiva_paralela(medicion)
+        medida = medir(masiva_paralela, args.repeticiones, memoria=False)
+        medida["procesos_usados"] = medicion.get("procesos", 1)
+        base = base or medida["segundos"]
+        medida["aceleracion"] = base / medida["segundos"]
+        resultados[f"masiva_{n}_procesos_{trabajadores}"] = medida
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "filas": filas_totales,
+        "semilla": args.semilla,
+        "procesos": args.procesos,
+        "trabajadores": args.trabajadores,
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+
+def imprimir(reporte, anterior=None):
+    print(f"\n{reporte['filas']:,} filas · pandas {reporte['pandas']} · {reporte['plataforma']} · "
+          f"{reporte.get('cpus', '?')} CPU")
+    print(f"{'fase':<36}{'segundos':>10}{'pico MB':>10}" + (f"{'antes s':>10}{'cambio':>9}" if anterior else ""))
+    for fase, r in reporte["resultados"].items():
+        pico = f"{r['pico_mb']:.1f}" if r["pico_mb"] is not None else "-"
+        linea = f"{fase:<36}{r['segundos']:>10.3f}{pico:>10}"
+        previo = (anterior or {}).get("resultados", {}).get(fase)
+        if previo:
+            linea += f"{previo['segundos']:>10.3f}{(r['segundos'] / previo['segundos'] - 1) * 100:>+8.0f}%"
+        if "aceleracion" in r:
+            linea += f"   x{r['aceleracion']:.2f} vs el primero"
+            if r.get("procesos_usados") == 1:
+                linea += " (en serie)"
+        print(linea)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del motor de búsqueda de nómina.")
+    parser.add_argument("-n", "--filas", type=int, default=100_000, help="total de filas sintéticas")
+    parser.add_argument("-c", "--carpeta", help="carpeta de los libros sintéticos (por defecto bench_datos/<filas>)")
+    parser.add_argument("--criterios", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="tamaños de plantilla para la búsqueda masiva")
+    parser.add_argument("-r", "--repeticiones", type=int, default=3)
+    parser.add_argument("-p", "--procesos", type=int, default=motor_nomina.MAX_PROCESOS_CARGA)
+    parser.add_argument("-w", "--trabajadores", type=int, nargs="+", default=[1, 2, 4],
+                        help="procesos para medir la aceleración de la búsqueda masiva (el primero es la base)")
+    parser.add_argument("-s", "--semilla", type=int, default=7)
+    parser.add_argument("--regenerar", action="store_true", help="vuelve a generar los libros sintéticos")
+    parser.add_argument("--sin-memoria", action="store_true", help="omite la corrida con tracemalloc")
+    parser.add_argument("-o", "--salida", help="guarda el reporte en este JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para mostrar el cambio")
+    args = parser.parse_args(argv)
+
+    reporte = correr(args)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir(reporte, anterior)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Genera libros de nómina sintéticos con el mismo esquema que usan la app y el motor.
+
+Uso:
+    python benchmarks/generar_libros.py DESTINO --filas 100000 [--semilla 7]
+
+Crea control_nomina.xlsx, Historico.xlsx, CONSOLIDAR.xlsx, PLANTILLA.xlsx y VARIOS.xlsx con
+las columnas RFC, NOMBRE, ADSCRIPCION, CUENTA, ASUNTO, NETO, etc. `--filas` es el total de
+filas repartido entre los libros (la mayor parte va a HISTORICO, como en producción). Ningún
+dato es real. Las hojas se escriben en modo write-only de openpyxl y se parten al llegar al
+límite de filas de Excel, así que se pueden generar millones de filas sin agotar la memoria.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from openpyxl import Workbook
+
+NOMBRES = ["JUAN", "MARÍA", "JOSÉ", "ANA", "LUIS", "SOFÍA", "MIGUEL", "LAURA", "JESÚS", "GUADALUPE",
+           "FRANCISCO", "VERÓNICA", "ÁNGEL", "MÓNICA", "RAÚL", "PATRICIA", "CÉSAR", "ROCÍO", "IVÁN", "NOEMÍ"]
+APELLIDOS = ["HERNÁNDEZ", "GARCÍA", "MARTÍNEZ", "LÓPEZ", "GONZÁLEZ", "PÉREZ", "RODRÍGUEZ", "SÁNCHEZ",
+             "RAMÍREZ", "CRUZ", "GÓMEZ", "FLORES", "MUÑOZ", "PEÑA", "JIMÉNEZ", "CANDIA", "ALARCÓN",
+             "CARACAS", "NIETO", "RIVERA", "MORALES", "ORTIZ", "CASTILLO", "IBÁÑEZ"]
+JURISDICCIONES = ["XALAPA", "VERACRUZ", "CÓRDOBA", "ORIZABA", "POZA RICA", "COATZACOALCOS",
+                  "TUXPAN", "MARTÍNEZ DE LA TORRE", "SAN ANDRÉS TUXTLA", "PÁNUCO", "COSAMALOAPAN"]
+ADSCRIPCIONES = [f"{tipo} {lugar}" for tipo in ("HOSPITAL GENERAL", "CENTRO DE SALUD", "JURISDICCIÓN SANITARIA",
+                                                 "OFICINA CENTRAL", "HOSPITAL DE LA COMUNIDAD")
+                 for lugar in JURISDICCIONES]
+CODIGOS = {f"M{n:05d}": desc for n, desc in enumerate(
+    ["MÉDICO GENERAL", "ENFERMERA GENERAL", "QUÍMICO", "ADMINISTRATIVO", "CAMILLERO", "COCINERO",
+     "MÉDICO ESPECIALISTA", "TRABAJADORA SOCIAL", "TÉCNICO RADIÓLOGO", "PSICÓLOGO"], start=1000)}
+NOMINAS = ["EVENTUAL", "EVENTUAL EXTRAORDINARIA", "HONORARIOS", "SUPLENCIAS"]
+ASUNTOS = ["ALTA", "BAJA", "REINGRESO", "PAGO INDEBIDO", "CAMBIO DE ADSCRIPCIÓN", "LICENCIA", "", ""]
+COLUMNAS = ["DES_JURIS", "RFC", "NOMBRE", "F. INGRESO", "CODIGO", "DESCRIPCION DEL CODIGO", "ADSCRIPCION",
+            "CUENTA", "CLABE", "ULTIMO PAGO PROGRAMADO", "PERCEPCIONES", "DEDUCCIONES", "NETO", "NOMINA",
+            "OFICIO ELABORADO", "ASUNTO"]
+MAX_FILAS_HOJA = 1_048_575  # límite de Excel menos el encabezado
+
+# Reparto del total de filas entre libros y hojas (libro: {hoja: proporción})
+LIBROS = {
+    "control_nomina.xlsx": {"NOMINA ACTUAL": 0.04, "BAJAS": 0.01},
+    "Historico.xlsx": {"2021": 0.15, "2022": 0.2, "2023": 0.25, "2024": 0.2},
+    "CONSOLIDAR.xlsx": {"CONSOLIDADO": 0.08},
+    "PLANTILLA.xlsx": {"PLANTILLA": 0.04},
+    "VARIOS.xlsx": {"OFICIOS": 0.02, "PENSIONES": 0.01},
+}
+
+def generar_empleados(n, rng):
+    """Plantilla de empleados ficticios; cada uno aparece en muchas quincenas del histórico."""
+    empleados = []
+    for i in range(n):
+        paterno, materno = rng.choice(APELLIDOS), rng.choice(APELLIDOS)
+        nombre = rng.choice(NOMBRES) + (f" {rng.choice(NOMBRES)}" if rng.random() < 0.3 else "")
+        nacimiento = datetime(1960, 1, 1) + timedelta(days=rng.randrange(15000))
+        rfc = f"{paterno[:2]}{materno[0]}{nombre[0]}{nacimiento:%y%m%d}{i % 1000:03d}"
+        codigo = rng.choice(list(CODIGOS))
+        empleados.append({
+            "RFC": rfc.replace("Ñ", "X").replace("Á", "A").replace("É", "E").replace("Í", "I")
+                      .replace("Ó", "O").replace("Ú", "U"),
+            "NOMBRE": f"{paterno} {materno} {nombre}",
+            "DES_JURIS": rng.choice(JURISDICCIONES),
+            "ADSCRIPCION": rng.choice(ADSCRIPCIONES),
+            "CODIGO": codigo,
+            "DESCRIPCION DEL CODIGO": CODIGOS[codigo],
+            "CUENTA": str(rng.randrange(10**9, 10**10)),
+            "CLABE": f"0128{rng.randrange(10**13, 10**14)}",
+            "F. INGRESO": datetime(2005, 1, 1) + timedelta(days=rng.randrange(7000)),
+            "NOMINA": rng.choice(NOMINAS),
+            "SUELDO": round(rng.uniform(6000, 45000), 2),
+        })
+    return empleados
+
+def filas_hoja(n, empleados, rng):
+    for _ in range(n):
+        emp = rng.choice(empleados)
+        percepciones = round(emp["SUELDO"] * rng.uniform(0.95, 1.1), 2)
+        deducciones = round(percepciones * rng.uniform(0.1, 0.3), 2)
+        registro = dict(emp,
+                        **{"ULTIMO PAGO PROGRAMADO": f"{rng.choice(['1A', '2A'])} QNA {rng.randrange(1, 13):02d}/2024",
+                           "PERCEPCIONES": percepciones,
+                           "DEDUCCIONES": deducciones,
+                           "NETO": round(percepciones - deducciones, 2),
+                           "OFICIO ELABORADO": f"SESVER/{rng.randrange(1, 9999):04d}/2024" if rng.random() < 0.2 else None,
+                           "ASUNTO": rng.choice(ASUNTOS) or None})
+        yield [registro[col] for col in COLUMNAS]
+
+def generar_libros(destino, filas, semilla=7):
+    """Escribe los cinco libros en `destino` y devuelve {archivo: {hoja: filas}}."""
+    rng = random.Random(semilla)
+    os.makedirs(destino, exist_ok=True)
+    empleados = generar_empleados(max(10, filas // 20), rng)
+    resumen = {}
+    for archivo, hojas in LIBROS.items():
+        wb = Workbook(write_only=True)
+        resumen[archivo] = {}
+        for hoja, proporcion in hojas.items():
+            restantes = max(1, int(filas * proporcion))
+            parte = 1
+            while restantes > 0:
+                n = min(restantes, MAX_FILAS_HOJA)
+                nombre = hoja if parte == 1 else f"{hoja} ({parte})"
+                ws = wb.create_sheet(nombre)
+                ws.append(COLUMNAS)
+                for fila in filas_hoja(n, empleados, rng):
+                    ws.append(fila)
+                resumen[archivo][nombre] = n
+                restantes -= n
+                parte += 1
+        wb.save(os.path.join(destino, archivo))
+    return resumen
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera libros de nómina sintéticos.")
+    parser.add_argument("destino", help="carpeta donde se escriben los .xlsx")
+    parser.add_argument("-n", "--filas", type=int, default=10_000, help="total de filas entre todos los libros")
+    parser.add_argument("-s", "--semilla", type=int, default=7)
+    args = parser.parse_args(argv)
+    for archivo, hojas in generar_libros(args.destino, args.filas, args.semilla).items():
+        print(f"{archivo}: " + ", ".join(f"{hoja}={n}" for hoja, n in hojas.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Búsqueda masiva por línea de comandos, sin navegador ni Streamlit.
+
+Uso:
+    python busqueda_masiva_cli.py plantilla_busqueda.xlsx -o resultados.xlsx
+    python busqueda_masiva_cli.py plantilla_busqueda.xlsx -o resultados.xlsx --carpeta D:\\nomina --procesos 4
+    python busqueda_masiva_cli.py plantilla_busqueda.xlsx --metricas metricas_nomina.jsonl --memoria
+
+Carga los cinco libros de la carpeta (usando la caché columnar si está vigente), corre la
+búsqueda masiva con la plantilla y escribe una hoja por cada "LIBRO - hoja" con coincidencias.
+"""
+import argparse
+import logging
+import sys
+import time
+import pandas as pd
+import motor_nomina
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Búsqueda masiva en los libros de nómina.")
+    parser.add_argument("plantilla", help="plantilla_busqueda.xlsx con los criterios (RFC, NOMBRE, ...)")
+    parser.add_argument("-o", "--salida", default="resultados_busqueda_masiva.xlsx",
+                        help="archivo .xlsx donde se escriben los resultados")
+    parser.add_argument("-c", "--carpeta", default=motor_nomina.CARPETA_PREDETERMINADA,
+                        help="carpeta con control_nomina.xlsx, Historico.xlsx, etc.")
+    parser.add_argument("-p", "--procesos", type=int, default=motor_nomina.MAX_PROCESOS_CARGA,
+                        help="procesos para parsear los Excel sin caché (1 = en serie)")
+    parser.add_argument("-w", "--trabajadores", type=int, default=1,
+                        help="procesos para el cruce de la plantilla por bloques de filas (1 = en serie; "
+                             f"en paralelo solo con {motor_nomina.MIN_FILAS_PARALELO:,} filas o más)")
+    parser.add_argument("--difuso", action="store_true",
+                        help="compara NOMBRE de forma aproximada (acentos, errores, apellidos invertidos)")
+    parser.add_argument("--umbral", type=float, default=motor_nomina.UMBRAL_DIFUSO,
+                        help="similitud mínima (0-1) de NOMBRE con --difuso")
+    parser.add_argument("-m", "--metricas", help="agrega los tiempos por fase de la carga y la búsqueda a este JSONL")
+    parser.add_argument("--memoria", action="store_true",
+                        help="mide también la memoria asignada en cada fase (tracemalloc; bastante más lento) "
+                             "y la manda al log y a --metricas")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    motor_nomina.memoria_por_fase(args.memoria)
+    medir = bool(args.metricas or args.memoria)
+
+    inicio = time.perf_counter()
+    conjunto = motor_nomina.construir_conjunto(args.carpeta, max_procesos=args.procesos)
+    logging.info("Libros cargados en %.1f s", time.perf_counter() - inicio)
+    if medir:
+        motor_nomina.registrar_medicion(conjunto["medicion"], args.metricas)
+
+    df_busqueda = pd.read_excel(args.plantilla, engine="openpyxl")
+    inicio = time.perf_counter()
+    medicion = motor_nomina.nueva_medicion("busqueda_masiva", origen="cli") if medir else None
+    encontradas = set()
+    resultados = motor_nomina.buscar_masivo_todos_libros(conjunto["libros"], df_busqueda,
+                                                         normalizados=conjunto["normalizados"], plan=conjunto["plan"],
+                                                         indices=conjunto["indices"], medicion=medicion,
+                                                         difuso=args.difuso, umbral=args.umbral,
+                                                         encontradas=encontradas, procesos=args.trabajadores,
+                                                         huellas=conjunto["huellas"], carpeta=args.carpeta)
+    if medicion is not None:
+        motor_nomina.registrar_medicion(medicion, args.metricas)
+    logging.info("Búsqueda masiva de %d filas en %.1f s", len(df_busqueda), time.perf_counter() - inicio)
+    for clave, df_res in resultados.items():
+        logging.info("%s: %d filas", clave, len(df_res))
+
+    logging.info("%d filas de la plantilla sin coincidencias", len(df_busqueda) - len(encontradas))
+
+    inicio = time.perf_counter()
+    motor_nomina.exportar_resultados_excel(resultados, args.salida, df_busqueda, encontradas)
+    logging.info("Resultados escritos en %s en %.1f s", args.salida, time.perf_counter() - inicio)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
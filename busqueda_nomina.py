@@ -3,29 +3,9 @@ import pandas as pd
 import os
 import socket
 import io
-import numpy as np  # <- para búsquedas rápidas
-import requests
-
-# =========================
-# Función para descargar archivos desde Google Drive
-# =========================
-def descargar_drive(url, destino):
-    """Descarga un archivo desde un enlace directo de Google Drive."""
-    try:
-        r = requests.get(url, allow_redirects=True)
-        if r.status_code == 200:
-            with open(destino, "wb") as f:
-                f.write(r.content)
-            if os.path.getsize(destino) < 1024:
-                st.warning(f"El archivo {destino} parece estar vacío o corrupto.")
-                return False
-            return True
-        else:
-            st.warning(f"No se pudo descargar: {url}")
-            return False
-    except Exception as e:
-        st.error(f"Error descargando {url}: {e}")
-        return False
+import tempfile
+import threading
+import motor_nomina  # <- carga y búsquedas (sin Streamlit)
 
 # =========================
 # URLs directas de Google Drive (export=download)
@@ -41,15 +21,99 @@ urls_drive = {
 # =========================
 # Carpeta local temporal
 # =========================
-carpeta = r"C:\Users\USER-PC0045\Pictures\PAGINA EVENTUAL"
+carpeta = motor_nomina.CARPETA_PREDETERMINADA
 os.makedirs(carpeta, exist_ok=True)
+ARCHIVO_METRICAS = os.path.join(carpeta, "metricas_nomina.jsonl")  # una línea JSON por carga o búsqueda
+
+@st.cache_resource
+def ultimas_mediciones():
+    """Últimas mediciones del servidor que no pertenecen a una sesión (descargas)."""
+    return {}
+
+# =========================
+# Almacén de datos compartido por todas las sesiones
+# =========================
+# Un solo conjunto de solo lectura por proceso del servidor (hojas originales, copias
+# normalizadas e índices). Cada sesión guarda únicamente la versión que está usando.
+# La descarga y la carga inicial corren en un hilo que arranca con la primera visita: el
+# login aparece de inmediato y cada libro se puede buscar en cuanto queda listo.
+PROCESOS_CARGA = motor_nomina.MAX_PROCESOS_CARGA  # 1 = carga en serie
+SEGUNDOS_ESTADO = 2  # cada cuánto se revisa el estado de los libros mientras cargan
+
+def descargar_faltantes(ultimas, avisos):
+    """Descarga los archivos que no existen o están corruptos; sin ellos no hay qué cargar."""
+    faltantes = {nombre: url for nombre, url in urls_drive.items()
+                 if not os.path.exists(os.path.join(carpeta, nombre))
+                 or os.path.getsize(os.path.join(carpeta, nombre)) < 1024}
+    if faltantes:
+        medicion_descarga = motor_nomina.nueva_medicion("descarga")
+        for nombre, (estado, mensaje) in motor_nomina.descargar_archivos_drive(faltantes, carpeta,
+                                                                              medicion=medicion_descarga).items():
+            if estado == "error":
+                avisos.append(mensaje)
+        ultimas["descarga"] = motor_nomina.registrar_medicion(medicion_descarga, ARCHIVO_METRICAS)
+
+def revisar_drive(ultimas):
+    """Pregunta a Drive si cambiaron los archivos ya descargados; devuelve si se bajó alguno."""
+    medicion = motor_nomina.nueva_medicion("revision_drive")
+    resultados = motor_nomina.descargar_archivos_drive(urls_drive, carpeta, solo_existentes=True, medicion=medicion)
+    ultimas["revision_drive"] = motor_nomina.registrar_medicion(medicion, ARCHIVO_METRICAS)
+    return any(estado == "descargado" for estado, _ in resultados.values())
+
+def reemplazar_conjunto(almacen, medicion=None):
+    """Reconstruye el conjunto reutilizando las hojas sin cambios y lo sustituye de una sola vez."""
+    with almacen["candado"]:
+        nuevo = motor_nomina.construir_conjunto(carpeta, almacen["actual"]["version"] + 1, PROCESOS_CARGA, medicion,
+                                                anterior=almacen["actual"])
+        motor_nomina.registrar_medicion(nuevo["medicion"], ARCHIVO_METRICAS)
+        almacen["actual"] = nuevo
+    return nuevo["version"]
+
+def precalentar(almacen, ultimas):
+    """Hilo de arranque: carga los libros que ya están en disco, publicando cada uno en cuanto
+    queda listo (CONTROL primero), y después pregunta a Drive por cambios.
+
+    Solo se espera a Drive por los archivos que faltan. Si la revisión baja algún libro nuevo,
+    el conjunto se reconstruye reutilizando las hojas sin cambios. El candado se toma solo al
+    publicar; mientras dura la carga inicial la actualización manual está deshabilitada, así
+    que nadie más reemplaza el conjunto.
+    """
+    def publicar(libro, parcial):
+        with almacen["candado"]:
+            almacen["actual"] = dict(parcial, version=almacen["actual"]["version"] + 1)
+            if not parcial["pendientes"]:
+                almacen["estado"] = "listo"
 
-# Descargar archivos si no existen o están corruptos
-for nombre, url in urls_drive.items():
-    destino = os.path.join(carpeta, nombre)
-    if not os.path.exists(destino) or os.path.getsize(destino) < 1024:
-        st.info(f"Descargando {nombre} desde Google Drive...")
-        descargar_drive(url, destino)
+    try:
+        descargar_faltantes(ultimas, almacen["avisos"])
+        almacen["estado"] = "cargando"
+        conjunto = motor_nomina.construir_conjunto(carpeta, 1, PROCESOS_CARGA, al_libro=publicar)
+        conjunto["medicion"]["version"] = almacen["actual"]["version"]
+        motor_nomina.registrar_medicion(conjunto["medicion"], ARCHIVO_METRICAS)
+    except Exception as e:
+        almacen["avisos"].append(f"Error en la carga inicial de los libros: {e}")
+        almacen["estado"] = "error"
+        return
+    try:
+        if revisar_drive(ultimas):
+            reemplazar_conjunto(almacen)
+    except Exception as e:
+        almacen["avisos"].append(f"Error al revisar los cambios en Drive: {e}")
+
+@st.cache_resource
+def almacen_datos():
+    """Almacén único del proceso: {"actual": conjunto vigente, "candado": Lock de actualización,
+    "estado": descargando/cargando/listo/error, "avisos": problemas de la precarga}.
+
+    Al crearse arranca la precarga en segundo plano; mientras tanto "actual" tiene solo los
+    libros ya listos y en "pendientes" los que faltan.
+    """
+    almacen = {"actual": motor_nomina.conjunto_vacio(), "candado": threading.Lock(),
+               "estado": "descargando", "avisos": []}
+    threading.Thread(target=precalentar, args=(almacen, ultimas_mediciones()), daemon=True).start()
+    return almacen
+
+almacen_datos()
 
 # =========================
 # LOGIN DE USUARIOS
@@ -106,8 +170,7 @@ if st.session_state.get("usuario_logueado"):
     with st.sidebar.expander("⚙️ Configuración"):
         if st.button("🔒 Cerrar sesión"):
             keys_a_borrar = ["usuario_logueado", "nombre_completo", "maestro", "mensaje_usuario",
-                             "data_excel","data_historico","data_consolidar","data_plantilla","data_varios",
-                             "resultados","resultados_mass","indice_nomina",
+                             "version_datos","busqueda_id","tope_individual","tope_masivo_usado","pendientes_individual","pendientes_masiva","medicion_individual","medicion_masiva","resultados","resultados_mass","encontradas_mass","plantilla_mass","indice_nomina",
                              "rfc","nombre","oficio_solicitud","adscripcion","cuenta","oficio_elaborado",
                              "asunto","columna_busqueda","valor_busqueda","limpiar_form","df_manual_mass","df_busqueda"]
             for key in keys_a_borrar:
@@ -155,45 +218,164 @@ st.markdown(f"""
 # =========================
 # Variables de sesión
 # =========================
-for key in ["data_excel","data_historico","data_consolidar","data_plantilla","data_varios","resultados","resultados_mass","indice_nomina"]:
+for key in ["version_datos","resultados","resultados_mass","indice_nomina","busqueda_id"]:
     if key not in st.session_state:
-        st.session_state[key] = None if key != "indice_nomina" else 0
-
-# =========================
-# Rutas de archivos locales
-# =========================
-archivo_excel = os.path.join(carpeta, "control_nomina.xlsx")
-archivo_historico = os.path.join(carpeta, "Historico.xlsx")
-archivo_consolidar = os.path.join(carpeta, "CONSOLIDAR.xlsx")
-archivo_plantilla = os.path.join(carpeta, "PLANTILLA.xlsx")
-archivo_varios = os.path.join(carpeta, "VARIOS.xlsx")
-
-# =========================
-# Función de carga con prevención de BadZipFile
-# =========================
-@st.cache_data
-def cargar_datos(ruta):
-    if not os.path.exists(ruta) or os.path.getsize(ruta) < 1024:
-        st.warning(f"El archivo {ruta} no existe o está corrupto")
-        return {}
-    try:
-        xls = pd.ExcelFile(ruta, engine="openpyxl")
-        data = {hoja: pd.read_excel(xls, sheet_name=hoja, engine="openpyxl") for hoja in xls.sheet_names}
-        return data
-    except Exception as e:
-        st.error(f"Error cargando {ruta}: {e}")
-        return {}
-
-# =========================
-# Cargar archivos automáticamente al iniciar
-# =========================
-for key, ruta in [("data_excel", archivo_excel), 
-                  ("data_historico", archivo_historico), 
-                  ("data_consolidar", archivo_consolidar), 
-                  ("data_plantilla", archivo_plantilla),
-                  ("data_varios", archivo_varios)]:
-    if key not in st.session_state or st.session_state[key] is None:
-        st.session_state[key] = cargar_datos(ruta)
+        st.session_state[key] = None if key not in ("indice_nomina", "busqueda_id") else 0
+
+# =========================
+# Datos vigentes y estado de los libros
+# =========================
+def datos_actuales():
+    return almacen_datos()["actual"]
+
+@st.cache_resource
+def cache_resultados():
+    """Caché LRU de búsquedas individuales compartida por las sesiones; se vacía sola al cambiar la versión."""
+    return motor_nomina.nueva_cache_resultados()
+
+def refrescar_almacen(medicion=None):
+    """Reconstruye el conjunto y lo sustituye de una sola vez.
+
+    Solo se vuelven a leer e indexar las hojas que cambiaron; las demás se toman del conjunto
+    vigente. Las búsquedas en curso terminan con el conjunto que ya tenían; las siguientes
+    usan el nuevo.
+    """
+    return reemplazar_conjunto(almacen_datos(), medicion)
+
+def estado_libros(version_pagina):
+    """Estado de cada libro en la precarga; si ya hay otro conjunto se vuelve a correr la página."""
+    almacen = almacen_datos()
+    actual = almacen["actual"]
+    if actual["version"] != version_pagina:
+        st.rerun()
+    for libro in motor_nomina.ARCHIVOS_LIBROS:
+        if libro in actual["libros"]:
+            st.caption(f"✅ {libro}: {len(actual['libros'][libro])} hoja(s)")
+        elif almacen["estado"] == "error":
+            st.caption(f"❌ {libro}: no se cargó")
+        elif almacen["estado"] == "cargando" and libro == actual["pendientes"][0]:
+            st.caption(f"⏳ {libro}: cargando...")
+        else:
+            st.caption(f"🕓 {libro}: {'descargando' if almacen['estado'] == 'descargando' else 'en espera'}")
+
+conjunto = datos_actuales()
+for aviso in almacen_datos()["avisos"] + conjunto["avisos"]:
+    st.warning(aviso)
+with st.sidebar.expander("📚 Libros", expanded=bool(conjunto["pendientes"])):
+    cargando = conjunto["pendientes"] and almacen_datos()["estado"] != "error"
+    st.fragment(run_every=SEGUNDOS_ESTADO if cargando else None)(estado_libros)(conjunto["version"])
+# Durante la precarga no se avisa de cada libro nuevo; la versión se fija al completarse
+if not conjunto["pendientes"] and st.session_state["version_datos"] != conjunto["version"]:
+    if st.session_state["version_datos"] is not None:
+        st.sidebar.info(f"Los datos se actualizaron (versión {conjunto['version']}).")
+    st.session_state["version_datos"] = conjunto["version"]
+
+with st.sidebar.expander("📇 Índice de búsqueda"):
+    st.caption(f"Versión de datos: {conjunto['version']}")
+    for libro, info in conjunto["indices"].items():
+        st.caption(f"{libro}: {info['segundos']:.2f} s · {info['bytes'] / 1024**2:.1f} MB")
+    for libro, (antes, despues, normalizada, bytes_indices) in conjunto["memoria"].items():
+        st.caption(f"{libro} en memoria: {antes / 1024**2:.1f} MB → {despues / 1024**2:.1f} MB · "
+                   f"total {(despues + normalizada + bytes_indices) / 1024**2:.1f} MB con copia normalizada "
+                   f"({normalizada / 1024**2:.1f} MB) e índices ({bytes_indices / 1024**2:.1f} MB)")
+
+if st.session_state.get("maestro"):
+    with st.sidebar.expander("🗄️ Datos"):
+        precargando = almacen_datos()["estado"] not in ("listo", "error")
+        if st.button("🔄 Descargar y actualizar datos", disabled=precargando,
+                     help="Disponible al terminar la carga inicial de los libros." if precargando else None):
+            with st.spinner("Descargando archivos y recargando los libros..."):
+                medicion_actualizacion = motor_nomina.nueva_medicion("actualizacion")
+                for nombre, (estado, mensaje) in motor_nomina.descargar_archivos_drive(
+                        urls_drive, carpeta, medicion=medicion_actualizacion, forzar=True).items():
+                    if estado == "error":
+                        st.warning(mensaje)
+                st.session_state["version_datos"] = refrescar_almacen(medicion_actualizacion)
+            conjunto = datos_actuales()
+            st.success(f"Datos actualizados (versión {conjunto['version']})")
+
+# Panel de rendimiento (solo maestros); se llena al final del script para incluir la búsqueda actual
+panel_rendimiento = st.sidebar.expander("⏱️ Rendimiento") if st.session_state.get("maestro") else None
+
+def mostrar_medicion(medicion, titulo):
+    """Tiempos por fase y detalle por hoja de una medición del motor."""
+    st.markdown(f"**{titulo}** · {medicion['fecha']} · {medicion['segundos']:.2f} s")
+    if "procesos" in medicion:
+        st.caption(f"Cruce en paralelo con {medicion['procesos']} procesos")
+    if "cache" in medicion:
+        st.caption(f"Caché de resultados: {medicion['cache']}")
+    if medicion.get("libros_pendientes"):
+        st.caption(f"Libros aún sin cargar: {', '.join(medicion['libros_pendientes'])}")
+    if "hojas_reutilizadas" in medicion:
+        st.caption(f"Hojas sin cambios reutilizadas: {medicion['hojas_reutilizadas']}")
+    if "plan" in medicion:
+        plan = medicion["plan"]
+        st.caption(f"Plan: {plan['revisadas']} de {plan['hojas']} hojas revisadas, {plan['podadas']} descartadas · "
+                   f"columnas: {', '.join(map(str, plan['columnas'])) or '-'}")
+    fases = pd.DataFrame({"Fase": list(medicion["fases"]),
+                          "Segundos": [round(s, 3) for s in medicion["fases"].values()]})
+    if medicion["memoria"]:
+        fases["MB"] = [round(medicion["memoria"].get(f, 0) / 1024**2, 1) for f in medicion["fases"]]
+    st.dataframe(fases, hide_index=True)
+    if medicion["hojas"]:
+        hojas = pd.DataFrame(medicion["hojas"])
+        if "segundos" in hojas:
+            hojas["segundos"] = hojas["segundos"].round(3)
+        st.dataframe(hojas, hide_index=True, height=180)
+
+# =========================
+# Resultados paginados: solo se envía al navegador la página visible
+# =========================
+FILAS_POR_PAGINA = 100
+
+def mostrar_conteos(resultados, tope=None):
+    """Tabla con las coincidencias de cada hoja, antes de mostrar los resultados."""
+    conteos = pd.DataFrame({
+        "Hoja": list(resultados),
+        "Coincidencias": [f"{len(df):,}" + (" (tope)" if tope and len(df) >= tope else "")
+                          for df in resultados.values()]
+    })
+    st.dataframe(conteos, hide_index=True)
+
+def mostrar_paginado(df, clave, width=1500, height=180):
+    """Muestra una página de `FILAS_POR_PAGINA` filas del resultado con su selector de página."""
+    paginas = max(1, -(-len(df) // FILAS_POR_PAGINA))
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, step=1,
+                                 key=f"pagina_{st.session_state['busqueda_id']}_{clave}")
+    inicio = (pagina - 1) * FILAS_POR_PAGINA
+    st.caption(f"Filas {inicio + 1:,}–{min(inicio + FILAS_POR_PAGINA, len(df)):,} de {len(df):,}")
+    st.dataframe(df.iloc[inicio:inicio + FILAS_POR_PAGINA], width=width, height=height)
+
+def excel_masivo(resultados, df_busqueda, encontradas):
+    """Función sin argumentos que arma el .xlsx de la búsqueda masiva al pulsar la descarga.
+
+    El libro se escribe en un archivo temporal (no en memoria) que Streamlit lee una sola vez;
+    va sin búfer porque Streamlit solo acepta archivos crudos o de lectura, y se borra solo
+    al cerrarse cuando Streamlit lo suelta.
+    """
+    def generar():
+        salida = tempfile.TemporaryFile(suffix=".xlsx", buffering=0)
+        try:
+            motor_nomina.exportar_resultados_excel(resultados, salida, df_busqueda, encontradas)
+        except Exception:
+            salida.close()
+            raise
+        salida.seek(0)
+        return salida
+    return generar
+
+def avisar_pendientes(pendientes):
+    """Advierte qué libros no entraron en la búsqueda porque aún se estaban cargando."""
+    if pendientes:
+        st.warning(f"Esta búsqueda no incluye {', '.join(pendientes)}: aún se están cargando.")
+
+def mostrar_resultados(resultados, prefijo, tope=None):
+    mostrar_conteos(resultados, tope)
+    for hoja, df_res in resultados.items():
+        st.subheader(f"Resultados de '{hoja}'")
+        mostrar_paginado(df_res, f"{prefijo}_{hoja}")
 
 # =========================
 # Mostrar resultados (ajustado)
@@ -274,105 +456,12 @@ if "resultados" in st.session_state and st.session_state["resultados"]:
         st.markdown("</div>", unsafe_allow_html=True)
 
         st.subheader("Tabla completa de Nómina Actual")
-        st.dataframe(df, width=900, height=250)
+        mostrar_paginado(df, "nomina_actual", width=900, height=250)
 
     # 👉 Mostrar el mini resumen justo aquí (entre búsqueda y resultados)
+    # (el resto de las hojas se muestra paginado en la pestaña de búsqueda individual)
     mostrar_nomina_actual()
 
-    # =========================
-    # Mostrar el resto de las hojas debajo
-    # =========================
-    for hoja, df_res in resultados_ordenados.items():
-        if hoja != "NOMINA ACTUAL":
-            st.subheader(f"Resultados de '{hoja}'")
-            st.dataframe(df_res, width=1500, height=180)
-
-
-# =========================
-# Función de búsqueda individual optimizada con NumPy
-# =========================
-def buscar_datos_todos_libros(todos_los_libros, valores, asunto="", columna_especifica="", valor_especifico=""):
-    res = {}
-    total_hojas = sum([len(libro) for libro in todos_los_libros.values()])
-    progreso = st.progress(0)
-    hoja_idx = 0
-
-    valores_upper = {k: str(v).strip().upper() for k, v in valores.items() if v}
-
-    for libro_nombre, libro_dict in todos_los_libros.items():
-        for hoja, df in libro_dict.items():
-            hoja_idx += 1
-            progreso.progress(min(1.0, hoja_idx/total_hojas))
-            if df.empty:
-                continue
-
-            df_upper = df.fillna("").astype(str).applymap(lambda x: x.strip().upper())
-            mask = np.ones(len(df_upper), dtype=bool)
-
-            # Búsqueda exacta o parcial
-            if columna_especifica and valor_especifico:
-                if columna_especifica in df_upper.columns:
-                    mask &= df_upper[columna_especifica].str.contains(valor_especifico.strip().upper(), na=False)
-                else:
-                    mask &= False
-            else:
-                for col, val in valores_upper.items():
-                    if col in df_upper.columns:
-                        mask &= df_upper[col].str.contains(val, na=False)
-                    else:
-                        mask &= False
-                if asunto and "ASUNTO" in df_upper.columns:
-                    mask &= df_upper["ASUNTO"].str.contains(asunto.strip().upper(), na=False)
-
-            df_filtrado = df[mask]
-            if not df_filtrado.empty:
-                prefijo = "" if libro_nombre=="CONTROL" else f"{libro_nombre} - "
-                res[f"{prefijo}{hoja}"] = df_filtrado
-
-    return res
-
-# =========================
-# Función de búsqueda masiva optimizada sin desconfigurar
-# =========================
-def buscar_masivo_todos_libros(todos_los_libros, df_busqueda):
-    resultados_combinados = {}
-    total_hojas = sum([len(libro) for libro in todos_los_libros.values()])
-    hoja_idx = 0
-    progreso = st.progress(0)
-
-    df_busqueda = df_busqueda.fillna("").astype(str).applymap(lambda x: x.strip().upper())
-
-    for libro_nombre, libro_dict in todos_los_libros.items():
-        for hoja, df_hoja in libro_dict.items():
-            hoja_idx += 1
-            progreso.progress(min(1.0, hoja_idx/total_hojas))
-            if df_hoja.empty:
-                continue
-
-            df_hoja_upper = df_hoja.fillna("").astype(str).applymap(lambda x: x.strip().upper())
-            df_res_hoja = pd.DataFrame()
-
-            for _, fila_busq in df_busqueda.iterrows():
-                # Creamos máscara inicial True
-                mask = np.ones(len(df_hoja_upper), dtype=bool)
-
-                for col in df_busqueda.columns:
-                    val = fila_busq[col]
-                    if val != "":
-                        if col in df_hoja_upper.columns:
-                            mask &= df_hoja_upper[col] == val
-                        else:
-                            mask &= False
-
-                # Concatenamos solo filas que cumplan toda la fila de búsqueda
-                df_filtrado = df_hoja[mask]
-                if not df_filtrado.empty:
-                    df_res_hoja = pd.concat([df_res_hoja, df_filtrado], ignore_index=True)
-
-            if not df_res_hoja.empty:
-                resultados_combinados[f"{libro_nombre} - {hoja}"] = df_res_hoja
-
-    return resultados_combinados
 
 # =========================
 # Pestañas
@@ -394,6 +483,11 @@ with tab1:
         col5, col6 = st.columns(2)
         columna_busqueda_val = col5.text_input("Columna")
         valor_busqueda_val = col6.text_input("Valor a buscar")
+        tope_individual = st.number_input("Máximo de coincidencias por hoja (0 = sin tope)",
+                                          min_value=0, value=0, step=1000)
+        col7, col8 = st.columns(2)
+        difuso_individual = col7.checkbox("NOMBRE aproximado (acentos, errores, apellidos invertidos)")
+        umbral_individual = col8.slider("Similitud mínima", 0.5, 1.0, motor_nomina.UMBRAL_DIFUSO, 0.05)
 
         col_btn1, col_btn2 = st.columns(2)
         buscar = col_btn1.form_submit_button("Buscar")
@@ -406,32 +500,56 @@ with tab1:
                 del st.session_state[key]
         st.session_state.query_params = {}
 
+    medicion_individual = None
     if buscar:
+        medicion_individual = motor_nomina.nueva_medicion("busqueda", usuario=st.session_state["usuario_logueado"],
+                                                          libros_pendientes=conjunto["pendientes"])
         valores_dict = {
             "RFC": rfc.strip(),
             "NOMBRE": nombre.strip(),
             "ADSCRIPCION": adscripcion.strip(),
             "CUENTA": cuenta.strip()
         }
-        todos_los_libros = {
-            "CONTROL": st.session_state["data_excel"],
-            "HISTORICO": st.session_state["data_historico"],
-            "CONSOLIDAR": st.session_state["data_consolidar"],
-            "PLANTILLA": st.session_state["data_plantilla"],
-            "VARIOS": st.session_state["data_varios"]
-        }
-        st.session_state["resultados"] = buscar_datos_todos_libros(
-            todos_los_libros, valores_dict,
+        clave_cache = motor_nomina.clave_busqueda(
+            conjunto["version"], valores_dict,
             asunto=asunto_val.strip(),
             columna_especifica=columna_busqueda_val.strip(),
-            valor_especifico=valor_busqueda_val.strip()
+            valor_especifico=valor_busqueda_val.strip(),
+            max_coincidencias=tope_individual or None,
+            difuso=difuso_individual,
+            umbral=umbral_individual
         )
+        # Búsquedas equivalentes (de esta u otra sesión) sobre la misma versión salen de la caché
+        def buscar_individual():
+            return motor_nomina.buscar_datos_todos_libros(
+                conjunto["libros"], valores_dict,
+                asunto=asunto_val.strip(),
+                columna_especifica=columna_busqueda_val.strip(),
+                valor_especifico=valor_busqueda_val.strip(),
+                normalizados=conjunto["normalizados"],
+                indices=conjunto["indices"],
+                plan=conjunto["plan"],
+                progreso=st.progress(0).progress,
+                max_coincidencias=tope_individual or None,
+                medicion=medicion_individual,
+                difuso=difuso_individual,
+                umbral=umbral_individual
+            )
+        st.session_state["resultados"] = motor_nomina.buscar_con_cache(cache_resultados(), clave_cache,
+                                                                       buscar_individual, medicion_individual)
+        st.session_state["tope_individual"] = tope_individual
+        st.session_state["pendientes_individual"] = conjunto["pendientes"]
+        st.session_state["busqueda_id"] += 1
         if not st.session_state["resultados"]:
             st.info("No se encontraron coincidencias.")
-        else:
-            for hoja, df_res in st.session_state["resultados"].items():
-                st.subheader(f"Resultados de '{hoja}'")
-                st.dataframe(df_res, width=1500, height=180)
+
+    if st.session_state.get("resultados") is not None:
+        avisar_pendientes(st.session_state.get("pendientes_individual"))
+    if st.session_state.get("resultados"):
+        with motor_nomina.medir_fase(medicion_individual, "render"):
+            mostrar_resultados(st.session_state["resultados"], "ind", st.session_state.get("tope_individual"))
+    if medicion_individual is not None:
+        st.session_state["medicion_individual"] = motor_nomina.registrar_medicion(medicion_individual, ARCHIVO_METRICAS)
 
 # =========================
 # Pestaña 2: Búsqueda Masiva
@@ -446,6 +564,15 @@ with tab2:
                        file_name="plantilla_busqueda.xlsx",
                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     archivo_carga = st.file_uploader("Sube la plantilla con los criterios de búsqueda", type=["xlsx"])
+    tope_masivo = st.number_input("Máximo de coincidencias por hoja (0 = sin tope)",
+                                  min_value=0, value=0, step=1000, key="tope_masivo")
+    procesos_masivo = st.number_input("Procesos para el cruce (1 = en serie)", min_value=1,
+                                      max_value=motor_nomina.MAX_PROCESOS_BUSQUEDA,
+                                      value=1, step=1, key="procesos_masivo",
+                                      help=f"Solo se usa con {motor_nomina.MIN_FILAS_PARALELO:,} filas o más en los libros.")
+    col_dif1, col_dif2 = st.columns(2)
+    difuso_masivo = col_dif1.checkbox("NOMBRE aproximado (acentos, errores, apellidos invertidos)", key="difuso_masivo")
+    umbral_masivo = col_dif2.slider("Similitud mínima", 0.5, 1.0, motor_nomina.UMBRAL_DIFUSO, 0.05, key="umbral_masivo")
     col_busq1, col_busq2 = st.columns(2)
     ejecutar_busqueda = col_busq1.button("🔍 Búsqueda masiva")
     limpiar_busqueda_mass = col_busq2.button("🧹 Limpiar búsqueda masiva")
@@ -457,25 +584,82 @@ with tab2:
     if limpiar_busqueda_mass:
         if "df_busqueda" in st.session_state:
             del st.session_state["df_busqueda"]
-        if "resultados_mass" in st.session_state:
-            del st.session_state["resultados_mass"]
+        for key in ["resultados_mass", "encontradas_mass", "plantilla_mass"]:
+            if key in st.session_state:
+                del st.session_state[key]
         st.session_state.query_params = {}
 
+    medicion_masiva = None
     if ejecutar_busqueda and st.session_state.get("df_busqueda") is not None:
-        todos_los_libros = {
-            "CONTROL": st.session_state["data_excel"],
-            "HISTORICO": st.session_state["data_historico"],
-            "CONSOLIDAR": st.session_state["data_consolidar"],
-            "PLANTILLA": st.session_state["data_plantilla"],
-            "VARIOS": st.session_state["data_varios"]
-        }
-        st.session_state["resultados_mass"] = buscar_masivo_todos_libros(todos_los_libros, st.session_state.df_busqueda)
+        medicion_masiva = motor_nomina.nueva_medicion("busqueda_masiva", usuario=st.session_state["usuario_logueado"],
+                                                      libros_pendientes=conjunto["pendientes"])
+        st.session_state["encontradas_mass"] = set()
+        st.session_state["plantilla_mass"] = st.session_state.df_busqueda
+        st.session_state["resultados_mass"] = motor_nomina.buscar_masivo_todos_libros(
+            conjunto["libros"], st.session_state.df_busqueda,
+            normalizados=conjunto["normalizados"],
+            plan=conjunto["plan"],
+            indices=conjunto["indices"],
+            progreso=st.progress(0).progress,
+            max_coincidencias=tope_masivo or None,
+            medicion=medicion_masiva,
+            difuso=difuso_masivo,
+            umbral=umbral_masivo,
+            encontradas=st.session_state["encontradas_mass"],
+            procesos=procesos_masivo,
+            huellas=conjunto["huellas"],
+            carpeta=carpeta
+        )
+        st.session_state["tope_masivo_usado"] = tope_masivo
+        st.session_state["pendientes_masiva"] = conjunto["pendientes"]
+        st.session_state["busqueda_id"] += 1
         if not st.session_state["resultados_mass"]:
             st.info("No se encontraron coincidencias.")
-        else:
-            for hoja, df_res in st.session_state["resultados_mass"].items():
-                st.subheader(f"Resultados de '{hoja}'")
-                st.dataframe(df_res, width=1500, height=180)
+
+    if st.session_state.get("resultados_mass") is not None:
+        avisar_pendientes(st.session_state.get("pendientes_masiva"))
+    if st.session_state.get("resultados_mass"):
+        with motor_nomina.medir_fase(medicion_masiva, "render"):
+            mostrar_resultados(st.session_state["resultados_mass"], "mass", st.session_state.get("tope_masivo_usado"))
+    if st.session_state.get("plantilla_mass") is not None:
+        # El libro se escribe por streaming solo cuando se pulsa el botón
+        sin_coincidencia = len(st.session_state["plantilla_mass"]) - len(st.session_state["encontradas_mass"])
+        st.download_button("📤 Descargar resultados en Excel",
+                           excel_masivo(st.session_state["resultados_mass"] or {}, st.session_state["plantilla_mass"],
+                                        st.session_state["encontradas_mass"]),
+                           file_name="resultados_busqueda_masiva.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                           on_click="ignore", key=f"excel_mass_{st.session_state['busqueda_id']}")
+        st.caption(f"Incluye la hoja {motor_nomina.HOJA_SIN_COINCIDENCIAS} con {sin_coincidencia} "
+                   f"fila(s) de la plantilla que no coincidieron en ninguna hoja"
+                   + (" (con el tope por hoja, algunas pueden haber quedado fuera)." if st.session_state.get("tope_masivo_usado") else "."))
+    if medicion_masiva is not None:
+        st.session_state["medicion_masiva"] = motor_nomina.registrar_medicion(medicion_masiva, ARCHIVO_METRICAS)
+
+# =========================
+# Panel de rendimiento (maestros)
+# =========================
+if panel_rendimiento is not None:
+    with panel_rendimiento:
+        st.caption(f"Registro: {ARCHIVO_METRICAS}")
+        motor_nomina.memoria_por_fase(st.toggle(
+            "Medir memoria por fase", value=motor_nomina.memoria_por_fase(),
+            help="Activa tracemalloc en todo el servidor: las siguientes cargas y búsquedas "
+                 "registran los MB de cada fase, pero tardan varias veces más."))
+        estadisticas = motor_nomina.estadisticas_cache(cache_resultados())
+        st.caption(f"Caché de búsquedas: {estadisticas['entradas']} entradas · {estadisticas['bytes'] / 1024**2:.1f} MB · "
+                   f"{estadisticas['aciertos']} aciertos / {estadisticas['fallos']} fallos "
+                   f"({estadisticas['tasa_aciertos']:.0%}) · {estadisticas['descartes']} descartadas · "
+                   f"{estadisticas['invalidaciones']} invalidaciones")
+        if not conjunto["pendientes"]:
+            mostrar_medicion(conjunto["medicion"], f"Carga de datos (versión {conjunto['version']})")
+        for clave, titulo in [("descarga", "Descarga inicial"), ("revision_drive", "Revisión de Drive")]:
+            if ultimas_mediciones().get(clave):
+                mostrar_medicion(ultimas_mediciones()[clave], titulo)
+        for clave, titulo in [("medicion_individual", "Última búsqueda individual"),
+                              ("medicion_masiva", "Última búsqueda masiva")]:
+            if st.session_state.get(clave):
+                mostrar_medicion(st.session_state[clave], titulo)
 
 # =========================
 # Pie de página
@@ -0,0 +1,1643 @@
+"""Motor de carga y búsqueda de los libros de nómina.
+
+No usa Streamlit ni hace nada al importarse: la app (busqueda_nomina.py) y la búsqueda
+masiva por línea de comandos (busqueda_masiva_cli.py) lo usan igual. El avance de las
+búsquedas se informa con una función `progreso(fraccion)` opcional y los avisos de carga
+se registran en el logger "motor_nomina".
+La carga y las búsquedas aceptan una `medicion` (ver `nueva_medicion`) donde anotan el
+tiempo de cada fase y las filas revisadas y encontradas por hoja.
+"""
+import os
+import re
+import sys
+import time
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import unicodedata
+import zipfile
+import xml.etree.ElementTree as ET
+from difflib import SequenceMatcher
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import requests
+from openpyxl import Workbook
+
+log = logging.getLogger("motor_nomina")
+
+# =========================
+# Libros de nómina
+# =========================
+CARPETA_PREDETERMINADA = r"C:\Users\USER-PC0045\Pictures\PAGINA EVENTUAL"
+ARCHIVOS_LIBROS = {"CONTROL": "control_nomina.xlsx",
+                   "HISTORICO": "Historico.xlsx",
+                   "CONSOLIDAR": "CONSOLIDAR.xlsx",
+                   "PLANTILLA": "PLANTILLA.xlsx",
+                   "VARIOS": "VARIOS.xlsx"}
+
+def rutas_libros(carpeta):
+    """{libro: ruta del archivo} de los cinco libros dentro de `carpeta`."""
+    return {libro: os.path.join(carpeta, archivo) for libro, archivo in ARCHIVOS_LIBROS.items()}
+
+# =========================
+# Instrumentación por fases (tiempos, filas y memoria)
+# =========================
+log_metricas = logging.getLogger("motor_nomina.metricas")
+candado_metricas = threading.Lock()
+
+def nueva_medicion(operacion, **datos):
+    """Registro vacío de una operación (carga, búsqueda...): fases, memoria por fase y detalle por hoja."""
+    return {"operacion": operacion, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), **datos,
+            "segundos": 0.0, "fases": {}, "memoria": {}, "hojas": [], "_inicio": time.perf_counter()}
+
+def memoria_por_fase(activa=None):
+    """Consulta o cambia si medir_fase suma también la memoria de cada fase.
+
+    Con `activa` se enciende o apaga tracemalloc para todo el proceso; mientras está
+    encendido cada asignación se rastrea y las operaciones tardan varias veces más.
+    Devuelve si quedó encendido.
+    """
+    if activa is not None and activa != tracemalloc.is_tracing():
+        if activa:
+            tracemalloc.start()
+        else:
+            tracemalloc.stop()
+    return tracemalloc.is_tracing()
+
+@contextmanager
+def medir_fase(medicion, fase):
+    """Suma a `medicion["fases"][fase]` el tiempo del bloque; sin medición no hace nada.
+
+    Si tracemalloc está activo (ver memoria_por_fase) también se suma la memoria que el
+    bloque dejó asignada.
+    """
+    if medicion is None:
+        yield
+        return
+    memoria = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion["fases"][fase] = medicion["fases"].get(fase, 0.0) + time.perf_counter() - inicio
+        if memoria is not None and tracemalloc.is_tracing():
+            medicion["memoria"][fase] = medicion["memoria"].get(fase, 0) + tracemalloc.get_traced_memory()[0] - memoria
+
+def medir_hoja(medicion, **datos):
+    """Agrega el detalle de una hoja (filas revisadas, coincidencias, segundos, bytes...)."""
+    if medicion is not None:
+        medicion["hojas"].append(datos)
+
+def registrar_medicion(medicion, ruta=None):
+    """Cierra la medición, la manda al log "motor_nomina.metricas" y, con `ruta`, la agrega
+    como una línea JSON al archivo para comparar versiones."""
+    if "_inicio" in medicion:
+        medicion["segundos"] = time.perf_counter() - medicion.pop("_inicio")
+    linea = json.dumps(medicion, ensure_ascii=False, default=str)
+    log_metricas.info(linea)
+    if ruta:
+        try:
+            with candado_metricas, open(ruta, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+        except OSError as e:
+            log.warning("No se pudo escribir %s: %s", ruta, e)
+    return medicion
+
+# =========================
+# Función para descargar archivos desde Google Drive
+# =========================
+def descargar_drive(url, destino, sesion, validadores=None, timeout=60):
+    """Descarga un archivo desde un enlace directo de Google Drive.
+
+    La respuesta se escribe por bloques en un temporal de la misma carpeta y se renombra
+    al terminar, así que un archivo a medio bajar nunca reemplaza al anterior. Con
+    `validadores` (ETag / Last-Modified de la descarga previa) la petición es condicional
+    y un 304 deja el archivo como está.
+    Devuelve (estado, validadores, mensaje) con estado "descargado", "sin_cambios" o "error".
+    """
+    encabezados = {}
+    if validadores and os.path.exists(destino):
+        if validadores.get("etag"):
+            encabezados["If-None-Match"] = validadores["etag"]
+        if validadores.get("last_modified"):
+            encabezados["If-Modified-Since"] = validadores["last_modified"]
+    temporal = None
+    try:
+        with sesion.get(url, headers=encabezados, stream=True, allow_redirects=True, timeout=timeout) as r:
+            if r.status_code == 304:
+                return "sin_cambios", validadores, ""
+            if r.status_code != 200:
+                return "error", validadores, f"No se pudo descargar: {url}"
+            fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                for trozo in r.iter_content(chunk_size=1 << 20):
+                    f.write(trozo)
+            nuevos = {"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+        if os.path.getsize(temporal) < 1024:
+            return "error", validadores, f"El archivo {destino} parece estar vacío o corrupto."
+        os.replace(temporal, destino)
+        temporal = None
+        return "descargado", nuevos, ""
+    except Exception as e:
+        return "error", validadores, f"Error descargando {url}: {e}"
+    finally:
+        if temporal and os.path.exists(temporal):
+            os.remove(temporal)
+
+def nombre_temporal(ruta):
+    """Temporal junto a `ruta` propio de este proceso e hilo: dos escritores nunca comparten uno."""
+    return f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def guardar_json(ruta, datos, permisos=None):
+    """Escribe un JSON de forma atómica (temporal propio + rename); `permisos` se aplican antes del rename."""
+    temporal = nombre_temporal(ruta)
+    try:
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        if permisos is not None:
+            os.chmod(temporal, permisos)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def descargar_archivos_drive(urls, carpeta, solo_existentes=False, max_hilos=5, timeout=60, medicion=None,
+                             forzar=False):
+    """Descarga en paralelo, con una sola sesión HTTP, los archivos de `urls` ({nombre: url}).
+
+    Los que faltan (o pesan menos de 1 KB) se descargan completos; los que ya existen se
+    revisan con petición condicional usando el ETag/Last-Modified guardado en
+    `.descargas.json`, y sin esos datos se dejan como están salvo con `forzar`, que los vuelve
+    a bajar completos y guarda sus validadores para las siguientes revisiones. Con
+    `solo_existentes` no se intenta bajar los faltantes. Devuelve {nombre: (estado, mensaje)}.
+    """
+    ruta_manifiesto = os.path.join(carpeta, ".descargas.json")
+    try:
+        with open(ruta_manifiesto, encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        manifiesto = {}
+
+    pendientes = {}
+    for nombre, url in urls.items():
+        destino = os.path.join(carpeta, nombre)
+        existe = os.path.exists(destino) and os.path.getsize(destino) >= 1024
+        validadores = manifiesto.get(nombre)
+        # Una entrada de otra URL o sin ETag ni Last-Modified no sirve para preguntar por cambios
+        if validadores and (validadores.get("url") != url
+                            or not (validadores.get("etag") or validadores.get("last_modified"))):
+            validadores = None
+        if existe and not validadores and not forzar:
+            continue
+        if not existe and solo_existentes:
+            continue
+        pendientes[nombre] = (url, destino, validadores if existe else None)
+    if not pendientes:
+        return {}
+
+    resultados = {}
+    with medir_fase(medicion, "descarga"), requests.Session() as sesion:
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=max_hilos, pool_maxsize=max_hilos)
+        sesion.mount("http://", adaptador)
+        sesion.mount("https://", adaptador)
+        with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+            futuros = {nombre: pool.submit(descargar_drive, url, destino, sesion, validadores, timeout)
+                       for nombre, (url, destino, validadores) in pendientes.items()}
+            for nombre, futuro in futuros.items():
+                estado, validadores, mensaje = futuro.result()
+                resultados[nombre] = (estado, mensaje)
+                if estado == "descargado":
+                    if validadores["etag"] or validadores["last_modified"]:
+                        manifiesto[nombre] = validadores
+                    else:
+                        manifiesto.pop(nombre, None)
+                medir_hoja(medicion, archivo=nombre, estado=estado,
+                           bytes=os.path.getsize(pendientes[nombre][1]) if estado == "descargado" else 0)
+    guardar_json(ruta_manifiesto, manifiesto)
+    return resultados
+
+# =========================
+# Lectura de los libros de Excel (serial o en paralelo)
+# =========================
+# Las funciones que corren dentro del pool de procesos deben poder importarse desde los
+# procesos hijo, por eso viven en este módulo y no en la app.
+MAX_PROCESOS_CARGA = os.cpu_count() or 1
+
+def leer_libro_excel(ruta, hojas=None):
+    """Parsea las hojas de un libro (todas o solo `hojas`), una tras otra: {hoja: DataFrame}."""
+    with pd.ExcelFile(ruta, engine="openpyxl") as xls:
+        return {hoja: pd.read_excel(xls, sheet_name=hoja, engine="openpyxl")
+                for hoja in (xls.sheet_names if hojas is None else hojas)}
+
+def leer_hoja_excel(ruta, hoja):
+    """Parsea una sola hoja (tarea de un proceso del pool)."""
+    return pd.read_excel(ruta, sheet_name=hoja, engine="openpyxl")
+
+def nombres_de_hojas(ruta):
+    """Nombres de las hojas en el orden del libro, sin leer su contenido."""
+    with pd.ExcelFile(ruta, engine="openpyxl") as xls:
+        return list(xls.sheet_names)
+
+def leer_libros_excel(rutas, max_procesos=None, hojas=None):
+    """Parsea varios libros repartiendo todas sus hojas en un pool de procesos.
+
+    Devuelve ({ruta: {hoja: DataFrame}}, {ruta: excepción}) con las hojas en el orden del
+    libro, igual que `leer_libro_excel`. Con `hojas` ({ruta: [hoja, ...]}) solo se parsean
+    esas hojas de cada libro. Con `max_procesos` <= 1, con una sola hoja en total o si el
+    pool no se puede usar (por ejemplo, sin permiso para crear procesos) se lee en serie.
+    """
+    datos, errores = {}, {}
+    for ruta, data, error in leer_libros_por_libro(rutas, max_procesos, hojas):
+        if error is None:
+            datos[ruta] = data
+        else:
+            errores[ruta] = error
+    return datos, errores
+
+def leer_libros_por_libro(rutas, max_procesos=None, hojas=None):
+    """Como `leer_libros_excel`, pero entrega cada libro en cuanto terminan sus hojas.
+
+    Las hojas de todos los libros se mandan juntas al pool, en el orden de `rutas`, y se
+    genera (ruta, {hoja: DataFrame}, None) o (ruta, None, excepción) por libro en ese mismo
+    orden, mientras el pool sigue con los demás. Si el pool se rompe, los libros que faltan
+    se leen en serie.
+    """
+    max_procesos = MAX_PROCESOS_CARGA if max_procesos is None else max_procesos
+    hojas, errores = dict(hojas or {}), {}
+    for ruta in rutas:
+        if ruta in hojas:
+            continue
+        try:
+            hojas[ruta] = nombres_de_hojas(ruta)
+        except Exception as e:
+            errores[ruta] = e
+    orden = list(dict.fromkeys([*rutas, *hojas]))
+    tareas = [(ruta, hoja) for ruta in orden if ruta in hojas for hoja in hojas[ruta]]
+    pool, futuros = None, {}
+    if max_procesos > 1 and len(tareas) > 1:
+        try:
+            pool = ProcessPoolExecutor(max_workers=min(max_procesos, len(tareas)))
+            futuros = {tarea: pool.submit(leer_hoja_excel, *tarea) for tarea in tareas}
+        except Exception:
+            # Pool no disponible: todo se lee en el proceso actual
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            pool = None
+    try:
+        for ruta in orden:
+            if ruta in errores:
+                yield ruta, None, errores[ruta]
+                continue
+            data, error = None, None
+            if pool is not None:
+                try:
+                    data = {hoja: futuros[(ruta, hoja)].result() for hoja in hojas[ruta]}
+                except BrokenProcessPool:
+                    pool.shutdown(cancel_futures=True)
+                    pool = None
+                except Exception as e:
+                    error = e
+            if data is None and error is None:
+                try:
+                    data = leer_libro_excel(ruta, hojas[ruta])
+                except Exception as e:
+                    error = e
+            yield ruta, data, error
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+# =========================
+# Caché columnar en disco (Arrow IPC) de los libros de Excel
+# =========================
+def carpeta_cache_de(ruta):
+    """La caché de un libro vive junto a él, en `.cache_columnar/<archivo>/`."""
+    return os.path.join(os.path.dirname(ruta), ".cache_columnar", os.path.basename(ruta))
+
+HORAS_TEMPORALES = 24  # un .tmp más viejo que esto quedó de un escritor que no terminó
+
+def carpeta_privada(ruta):
+    """Crea la carpeta si falta y la deja solo para el dueño (700): la caché guarda RFC, nombres y cuentas."""
+    os.makedirs(ruta, mode=0o700, exist_ok=True)
+    os.chmod(ruta, 0o700)
+
+def hash_archivo(ruta, bloque=1 << 20):
+    """SHA-256 del contenido del archivo, leído por bloques."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+# =========================
+# Huella de cada hoja del .xlsx, sin parsear las celdas
+# =========================
+NS_HOJA = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_RELACION = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PAQUETE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CELDAS_TEXTO = re.compile(rb'(<(?:\w+:)?c\b[^>]*\bt="s"[^>]*>\s*<(?:\w+:)?v>)(\d+)(</)')
+ATRIBUTO_ESTILO = re.compile(rb'(\bs=")(\d+)(")')
+
+def ruta_en_zip(destino):
+    """Ruta dentro del .xlsx de un destino de xl/_rels/workbook.xml.rels."""
+    return destino.lstrip("/") if destino.startswith("/") else "xl/" + destino
+
+def textos_compartidos(z, ruta):
+    """Lista de textos de sharedStrings.xml (uno por <si>), en orden."""
+    if ruta is None:
+        return []
+    textos = []
+    with z.open(ruta) as f:
+        for _, elemento in ET.iterparse(f):
+            if elemento.tag == NS_HOJA + "si":
+                textos.append("".join(t.text or "" for t in elemento.iter(NS_HOJA + "t")))
+                elemento.clear()
+    return textos
+
+def formatos_de_estilos(z, ruta):
+    """Formato numérico de cada estilo de celda (cellXfs), que decide si un número se lee como fecha."""
+    if ruta is None:
+        return []
+    raiz = ET.fromstring(z.read(ruta))
+    codigos = {nf.get("numFmtId"): nf.get("formatCode") for nf in raiz.iter(NS_HOJA + "numFmt")}
+    estilos = raiz.find(NS_HOJA + "cellXfs")
+    return [codigos.get(xf.get("numFmtId", "0"), "#" + xf.get("numFmtId", "0"))
+            for xf in (estilos if estilos is not None else [])]
+
+def huellas_hojas(ruta):
+    """SHA-256 de cada hoja del libro, en su orden: {hoja: huella}.
+
+    La huella cubre todo lo que determina lo que se lee de la hoja: su XML, los textos
+    compartidos que usa, el formato numérico de los estilos que usa y el modo de fechas 1904
+    del libro. Los números de texto compartido y de estilo se sustituyen por lo que
+    representan, porque Excel los renumera al guardar. Al agregar o modificar una hoja solo
+    cambia su huella.
+    """
+    with zipfile.ZipFile(ruta) as z:
+        libro = ET.fromstring(z.read("xl/workbook.xml"))
+        relaciones = {r.get("Id"): r for r in ET.fromstring(z.read("xl/_rels/workbook.xml.rels")).iter(NS_PAQUETE + "Relationship")}
+        por_tipo = {r.get("Type").rsplit("/", 1)[-1]: ruta_en_zip(r.get("Target")) for r in relaciones.values()}
+        textos = textos_compartidos(z, por_tipo.get("sharedStrings"))
+        formatos = formatos_de_estilos(z, por_tipo.get("styles"))
+        propiedades = libro.find(NS_HOJA + "workbookPr")
+        fecha_1904 = propiedades is not None and propiedades.get("date1904") in ("1", "true")
+        huellas = {}
+        for hoja in libro.iter(NS_HOJA + "sheet"):
+            xml = z.read(ruta_en_zip(relaciones[hoja.get(NS_RELACION + "id")].get("Target")))
+            h = hashlib.sha256(b"1904" if fecha_1904 else b"1900")
+            h.update(ATRIBUTO_ESTILO.sub(rb"\1\3", CELDAS_TEXTO.sub(rb"\1\3", xml)))
+            # Textos y formatos en el orden de las celdas del XML
+            h.update("\0".join(textos[int(m[1])] for m in CELDAS_TEXTO.findall(xml)).encode("utf-8"))
+            h.update("\1".join(formatos[int(i)] if int(i) < len(formatos) else ""
+                               for _, i, _ in ATRIBUTO_ESTILO.findall(xml)).encode("utf-8"))
+            huellas[hoja.get("name")] = h.hexdigest()
+    if not huellas:
+        raise ValueError(f"No se encontraron hojas en {ruta}")
+    return huellas
+
+def huellas_libro(ruta):
+    """Huellas por hoja; si el .xlsx no tiene la estructura esperada, todas dependen del archivo completo."""
+    try:
+        return huellas_hojas(ruta)
+    except (KeyError, ValueError, IndexError, zipfile.BadZipFile, ET.ParseError) as e:
+        log.info("Sin huellas por hoja para %s (%s); se usará el hash del archivo", ruta, e)
+        sha = hash_archivo(ruta)
+        return {hoja: f"{sha}-{i}" for i, hoja in enumerate(nombres_de_hojas(ruta))}
+
+def preparar_para_arrow(df):
+    """Deja la hoja en una forma que Arrow puede guardar y devuelve (tabla, DataFrame equivalente).
+
+    Los encabezados se guardan como texto y las columnas que mezclan texto con números o
+    fechas se convierten a texto (las vacías se respetan). Las búsquedas comparan el texto
+    de cada celda, así que los resultados no cambian.
+    """
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False), df
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        pass
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+    return pa.Table.from_pandas(df, preserve_index=False), df
+
+def desde_arrow(tabla):
+    """Convierte una tabla Arrow a DataFrame con los vacíos como NaN, igual que pd.read_excel."""
+    df = tabla.to_pandas()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].fillna(np.nan)
+    return df
+
+def manifiesto_vigente(ruta):
+    """Manifiesto de la caché del libro si sigue siendo válido; None si hay que volver a parsear.
+
+    La caché se valida por tamaño y fecha de modificación; si solo cambió la fecha
+    (por ejemplo, al volver a descargar el mismo archivo) se compara el hash del contenido.
+    """
+    ruta_manifiesto = os.path.join(carpeta_cache_de(ruta), "manifiesto.json")
+    try:
+        with open(ruta_manifiesto, encoding="utf-8") as f:
+            manifiesto = json.load(f)
+        info = os.stat(ruta)
+        if manifiesto["tamano"] != info.st_size:
+            return None
+        if manifiesto["mtime"] != info.st_mtime_ns:
+            if manifiesto["sha256"] != hash_archivo(ruta):
+                return None
+            manifiesto["mtime"] = info.st_mtime_ns
+            guardar_json(ruta_manifiesto, manifiesto, permisos=0o600)
+        return manifiesto
+    except (OSError, ValueError, KeyError):
+        return None
+
+def archivo_cache(huella):
+    """Cada hoja se guarda con el nombre de su huella: una hoja sin cambios conserva su archivo."""
+    return f"hoja_{huella[:32]}.arrow"
+
+def hojas_por_parsear(ruta, huellas):
+    """Hojas nuevas o modificadas: las que todavía no tienen archivo para su huella en la caché."""
+    dir_cache = carpeta_cache_de(ruta)
+    return [hoja for hoja, huella in huellas.items()
+            if not os.path.exists(os.path.join(dir_cache, archivo_cache(huella)))]
+
+def leer_hoja_cache(ruta, hoja, huella):
+    """Lee una hoja desde la caché (memory-map); si su archivo falla se parsea desde el Excel."""
+    try:
+        return desde_arrow(feather.read_table(os.path.join(carpeta_cache_de(ruta), archivo_cache(huella)),
+                                              memory_map=True))
+    except (OSError, pa.ArrowException):
+        return leer_hoja_excel(ruta, hoja)
+
+def escribir_cache_columnar(ruta, data, huellas):
+    """Guarda como archivo Arrow IPC cada hoja de `data` y escribe el manifiesto del libro
+    (tamaño, mtime, sha256 y la huella de cada hoja).
+
+    Las hojas de `huellas` que no vienen en `data` ya deben tener su archivo en la caché.
+    """
+    dir_cache = carpeta_cache_de(ruta)
+    carpeta_privada(dir_cache)
+    info = os.stat(ruta)
+    manifiesto = {"tamano": info.st_size, "mtime": info.st_mtime_ns, "sha256": hash_archivo(ruta), "hojas": []}
+    convertidos = {}
+    for hoja, huella in huellas.items():
+        archivo = archivo_cache(huella)
+        if hoja in data:
+            tabla, convertidos[hoja] = preparar_para_arrow(data[hoja])
+            temporal = nombre_temporal(os.path.join(dir_cache, archivo))
+            try:
+                feather.write_feather(tabla, temporal, compression="uncompressed")
+                os.chmod(temporal, 0o600)
+                os.replace(temporal, os.path.join(dir_cache, archivo))
+            finally:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+        elif not os.path.exists(os.path.join(dir_cache, archivo)):
+            raise FileNotFoundError(f"Falta en la caché la hoja {hoja} de {ruta}")
+        manifiesto["hojas"].append({"nombre": hoja, "archivo": archivo, "huella": huella})
+    # El manifiesto se escribe al final: sin él la caché no se considera válida
+    guardar_json(os.path.join(dir_cache, "manifiesto.json"), manifiesto, permisos=0o600)
+    vigentes = {hoja["archivo"] for hoja in manifiesto["hojas"]} | {"manifiesto.json"}
+    limite = time.time() - HORAS_TEMPORALES * 3600
+    for archivo in os.listdir(dir_cache):
+        sobrante = os.path.join(dir_cache, archivo)
+        try:
+            # Los .tmp recientes son de otro escritor (la app y un CLI nocturno) que sigue trabajando
+            if archivo in vigentes or (archivo.endswith(".tmp") and os.path.getmtime(sobrante) >= limite):
+                continue
+            os.remove(sobrante)
+        except OSError:
+            pass
+    return convertidos
+
+# =========================
+# Función de carga con prevención de BadZipFile
+# =========================
+def avisar(avisos, mensaje):
+    log.warning(mensaje)
+    if avisos is not None:
+        avisos.append(mensaje)
+
+def cargar_datos(ruta, avisos=None, conocidas=None):
+    """Carga un libro desde la caché columnar: ({hoja: DataFrame}, {hoja: huella}).
+
+    Si el Excel cambió solo se parsean sus hojas nuevas o modificadas y se actualiza la
+    caché. Las hojas cuya huella coincide con `conocidas` ({hoja: huella}) no se leen: quien
+    llama ya las tiene. Los problemas se registran en el log y se agregan a `avisos`; un
+    libro que no se pudo leer se devuelve vacío.
+    """
+    if not os.path.exists(ruta) or os.path.getsize(ruta) < 1024:
+        avisar(avisos, f"El archivo {ruta} no existe o está corrupto")
+        return {}, {}
+    conocidas = conocidas or {}
+    manifiesto = manifiesto_vigente(ruta)
+    nuevas = {}
+    if manifiesto is not None and all("huella" in hoja for hoja in manifiesto["hojas"]):
+        huellas = {hoja["nombre"]: hoja["huella"] for hoja in manifiesto["hojas"]}
+    else:
+        try:
+            huellas = huellas_libro(ruta)
+            nuevas = leer_libro_excel(ruta, hojas_por_parsear(ruta, huellas))
+        except Exception as e:
+            avisar(avisos, f"Error cargando {ruta}: {e}")
+            return {}, {}
+        try:
+            nuevas = escribir_cache_columnar(ruta, nuevas, huellas)
+        except Exception as e:
+            avisar(avisos, f"No se pudo guardar la caché columnar de {ruta}: {e}")
+    data = {}
+    for hoja, huella in huellas.items():
+        if hoja in nuevas:
+            data[hoja] = nuevas[hoja]
+        elif conocidas.get(hoja) != huella:
+            data[hoja] = leer_hoja_cache(ruta, hoja, huella)
+    return data, huellas
+
+# =========================
+# Carga en paralelo de los libros que no están en caché
+# =========================
+def precargar_libros(rutas, max_procesos=None, avisos=None):
+    """Parsea en un pool de procesos las hojas nuevas o modificadas de los libros sin caché
+    columnar vigente y la deja escrita.
+
+    Después `cargar_datos` los lee desde la caché; los libros con error se dejan para que
+    `cargar_datos` los reporte.
+    """
+    for _ in precargar_por_libro(rutas, max_procesos, avisos):
+        pass
+
+def precargar_por_libro(rutas, max_procesos=None, avisos=None):
+    """Como `precargar_libros`, pero genera cada ruta de `rutas`, en orden, en cuanto su caché
+    quedó escrita (o no hacía falta), mientras el pool sigue con las hojas de los demás libros."""
+    pendientes = {}
+    for ruta in rutas:
+        if not os.path.exists(ruta) or os.path.getsize(ruta) < 1024 or manifiesto_vigente(ruta) is not None:
+            continue
+        try:
+            pendientes[ruta] = huellas_libro(ruta)
+        except Exception:
+            continue
+    lecturas = leer_libros_por_libro(list(pendientes), max_procesos=max_procesos,
+                                     hojas={ruta: hojas_por_parsear(ruta, huellas)
+                                            for ruta, huellas in pendientes.items()})
+    for ruta in rutas:
+        if ruta in pendientes:
+            _, data, error = next(lecturas)
+            if error is None:
+                try:
+                    escribir_cache_columnar(ruta, data, pendientes[ruta])
+                except Exception as e:
+                    avisar(avisos, f"No se pudo guardar la caché columnar de {ruta}: {e}")
+        yield ruta
+
+# =========================
+# Tipos compactos para las hojas cargadas
+# =========================
+PROPORCION_CATEGORIA = 0.5  # columnas de texto con pocos valores distintos -> category
+
+def optimizar_tipos(df):
+    """Devuelve la hoja con tipos de menor memoria sin cambiar ningún valor.
+
+    Texto repetido (DES_JURIS, NOMINA, CODIGO...) pasa a category y el resto del texto a
+    cadenas de Arrow. Los enteros se reducen al menor tipo que los contiene y los flotantes
+    pasan a float32 solo si cada valor (y su texto) queda idéntico. Las columnas que mezclan
+    texto con números o fechas se dejan como están.
+    """
+    df = df.copy()
+    for col in df.columns:
+        serie = df[col]
+        if serie.dtype == object or isinstance(serie.dtype, pd.StringDtype):
+            if pd.api.types.infer_dtype(serie, skipna=True) != "string":
+                continue
+            if serie.nunique() <= PROPORCION_CATEGORIA * len(serie):
+                df[col] = serie.astype("category")
+            else:
+                df[col] = serie.astype(pd.StringDtype("pyarrow"))
+        elif pd.api.types.is_integer_dtype(serie.dtype):
+            df[col] = pd.to_numeric(serie, downcast="integer")
+        elif serie.dtype == np.float64:
+            reducida = serie.astype(np.float32)
+            if reducida.astype(np.float64).equals(serie) and reducida.astype(str).equals(serie.astype(str)):
+                df[col] = reducida
+    return df
+
+def memoria_libro(hojas):
+    return sum(int(df.memory_usage(index=True, deep=True).sum()) for df in hojas.values())
+
+def memoria_resultados(resultados):
+    """Bytes propios de {clave: DataFrame} de resultados, que son recortes de las hojas cargadas.
+
+    Las columnas category cuentan solo sus códigos: las categorías son las de la hoja y ya
+    están en el conjunto (memory_usage las sumaría completas en cada recorte).
+    """
+    total = 0
+    for df in resultados.values():
+        total += int(df.index.memory_usage(deep=True))
+        for posicion, tipo in enumerate(df.dtypes):
+            serie = df.iloc[:, posicion]
+            if isinstance(tipo, pd.CategoricalDtype):
+                total += serie.cat.codes.nbytes
+            else:
+                total += int(serie.memory_usage(index=False, deep=True))
+    return total
+
+# =========================
+# Copia normalizada de las hojas (texto, sin espacios, mayúsculas)
+# =========================
+def normalizar_columna(serie):
+    """Texto limpio en mayúsculas de una columna, en tipos compactos.
+
+    Las categorías se normalizan una sola vez y la columna conserva sus códigos (las que
+    quedan iguales al normalizar se unen); el resto del texto queda como cadenas de Arrow.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = normalizar_columna(pd.Series(serie.cat.categories)).to_numpy(dtype=object)
+        # El código -1 (vacío) cae en la última posición, que es ""
+        recodificar, unicas = pd.factorize(np.append(categorias, ""))
+        codigos = recodificar[serie.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codigos, categories=unicas), index=serie.index)
+    return serie.fillna("").astype(str).str.strip().str.upper().astype(pd.StringDtype("pyarrow"))
+
+def normalizar_hoja(df):
+    """Devuelve una copia de la hoja con cada columna como texto limpio en mayúsculas (category o Arrow)."""
+    return pd.DataFrame({col: normalizar_columna(df[col]) for col in df.columns}, index=df.index)
+
+# =========================
+# Plan de consulta: qué columnas tiene cada hoja
+# =========================
+# Los encabezados se comparan sin acentos, mayúsculas ni signos ("ADSCRIPCIÓN" = "Adscripcion")
+# y con estos alias; la columna con el nombre exacto tiene prioridad sobre un alias.
+ALIAS_COLUMNAS = {"NOMBRE COMPLETO": "NOMBRE",
+                  "NOMBRE DEL EMPLEADO": "NOMBRE",
+                  "AREA DE ADSCRIPCION": "ADSCRIPCION",
+                  "NO CUENTA": "CUENTA",
+                  "NUM CUENTA": "CUENTA",
+                  "NUMERO DE CUENTA": "CUENTA",
+                  "CUENTA BANCARIA": "CUENTA"}
+
+def plegar_encabezado(nombre):
+    """Encabezado sin acentos ni signos, en mayúsculas y con un solo espacio: "R.F.C." -> "RFC"."""
+    texto = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode().upper()
+    return " ".join(re.sub(r"[^A-Z0-9 ]+", " ", texto.replace(".", "")).split())
+
+def clave_columna(nombre):
+    """Nombre canónico de una columna de búsqueda (encabezado plegado y resuelto por alias)."""
+    plegado = plegar_encabezado(nombre)
+    return ALIAS_COLUMNAS.get(plegado, plegado)
+
+def planificar_hoja(df):
+    """{"filas", "columnas": {clave canónica: columna real}} de una hoja."""
+    columnas = {}
+    for col in df.columns:
+        columnas.setdefault(plegar_encabezado(col), col)
+    for col in df.columns:
+        alias = ALIAS_COLUMNAS.get(plegar_encabezado(col))
+        if alias:
+            columnas.setdefault(alias, col)
+    return {"filas": len(df), "columnas": columnas}
+
+def planificar_conjunto(todos_los_libros):
+    """Plan de todas las hojas: {libro: {hoja: planificar_hoja(df)}}. Solo lee encabezados."""
+    return {libro: {hoja: planificar_hoja(df) for hoja, df in hojas.items()}
+            for libro, hojas in todos_los_libros.items()}
+
+def anotar_plan(medicion, total_hojas, podadas, columnas):
+    """Deja en la medición cuántas hojas descartó el plan y qué columnas se consultaron."""
+    if medicion is not None:
+        medicion["plan"] = {"hojas": total_hojas, "podadas": len(podadas), "revisadas": total_hojas - len(podadas),
+                            "hojas_podadas": podadas, "columnas": sorted(columnas)}
+
+# =========================
+# Índice invertido de trigramas para búsquedas parciales
+# =========================
+COLUMNAS_INDEXADAS = ["RFC", "NOMBRE", "ADSCRIPCION", "CUENTA", "ASUNTO"]
+CARACTERES_REGEX = set(".^$*+?{}[]\\|()")
+
+def construir_indice_columna(serie_norm):
+    """Construye el índice de trigramas de una columna normalizada.
+
+    Se indexan los valores únicos (el mismo nombre o RFC se repite en muchas quincenas):
+    cada trigrama apunta a los ids de valor que lo contienen y `codigos` lleva cada fila a su valor.
+    """
+    codigos, valores = pd.factorize(serie_norm)
+    listas = {}
+    for id_valor, texto in enumerate(valores):
+        for trigrama in {texto[i:i + 3] for i in range(len(texto) - 2)}:
+            listas.setdefault(trigrama, []).append(id_valor)
+    trigramas = {t: np.array(ids, dtype=np.int32) for t, ids in listas.items()}
+    valores = np.asarray(valores, dtype=object)
+    memoria = (codigos.nbytes + valores.nbytes + sum(sys.getsizeof(v) for v in valores)
+               + sys.getsizeof(trigramas) + sum(sys.getsizeof(t) + ids.nbytes for t, ids in trigramas.items()))
+    return {"codigos": codigos, "valores": valores, "trigramas": trigramas, "bytes": memoria}
+
+def buscar_en_indice(indice, valor):
+    """Máscara de filas cuyo valor contiene `valor` (ya normalizado).
+
+    Los trigramas del texto buscado reducen los candidatos y después se verifica la
+    subcadena sobre ellos. Devuelve None si el índice no aplica: textos de menos de
+    tres caracteres o con caracteres especiales de expresión regular.
+    """
+    if len(valor) < 3 or any(c in CARACTERES_REGEX for c in valor):
+        return None
+    candidatos = None
+    for trigrama in sorted({valor[i:i + 3] for i in range(len(valor) - 2)},
+                           key=lambda t: len(indice["trigramas"].get(t, ()))):
+        ids = indice["trigramas"].get(trigrama)
+        if ids is None:
+            return np.zeros(len(indice["codigos"]), dtype=bool)
+        candidatos = ids if candidatos is None else np.intersect1d(candidatos, ids, assume_unique=True)
+        if not len(candidatos):
+            return np.zeros(len(indice["codigos"]), dtype=bool)
+    valores = indice["valores"]
+    coincide = np.zeros(len(valores) + 1, dtype=bool)  # la última posición cubre códigos -1
+    coincide[[i for i in candidatos if valor in valores[i]]] = True
+    return coincide[indice["codigos"]]
+
+def construir_indices_libro(normalizados_libro, plan_libro=None, previos=None):
+    """Índices de trigramas de las columnas de texto de cada hoja: {hoja: {columna real: índice}}.
+
+    Las hojas que vienen en `previos` ({hoja: {columna: índice}}) reutilizan esos índices.
+    """
+    inicio = time.perf_counter()
+    indices = {}
+    for hoja, df_norm in normalizados_libro.items():
+        if previos and hoja in previos:
+            indices[hoja] = previos[hoja]
+            continue
+        columnas = (plan_libro or {}).get(hoja, planificar_hoja(df_norm))["columnas"]
+        indices[hoja] = {columnas[clave]: construir_indice_columna(df_norm[columnas[clave]])
+                         for clave in COLUMNAS_INDEXADAS if clave in columnas}
+        if "NOMBRE" in columnas:
+            agregar_indice_nombres(indices[hoja][columnas["NOMBRE"]])
+    return {"hojas": indices,
+            "segundos": time.perf_counter() - inicio,
+            "bytes": sum(ind["bytes"] for cols in indices.values() for ind in cols.values())}
+
+# =========================
+# Coincidencia aproximada de nombres (acentos, errores de captura, apellidos invertidos)
+# =========================
+UMBRAL_DIFUSO = 0.85  # similitud mínima (0-1) para aceptar un nombre
+PARTICULAS_NOMBRE = {"DE", "DEL", "LA", "LAS", "LOS", "Y", "VDA"}
+REGLAS_FONETICAS = [("LL", "Y"), ("QU", "K"), ("GUE", "GE"), ("GUI", "GI"), ("H", ""), ("V", "B"), ("W", "B"),
+                    ("Z", "S"), ("CE", "SE"), ("CI", "SI"), ("C", "K"), ("GE", "JE"), ("GI", "JI"), ("Y", "I")]
+
+def plegar_nombre(texto):
+    """Nombre sin acentos ni signos, en mayúsculas y con un solo espacio: "Hernández  Ñuñez" -> "HERNANDEZ NUNEZ"."""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode().upper()
+    return " ".join(re.sub(r"[^A-Z0-9]+", " ", texto).split())
+
+def clave_fonetica(palabra):
+    """Clave de cómo suena una palabra en español: "HERNANDEZ" y "HERNANDES" dan "ERNANDES"."""
+    for antes, despues in REGLAS_FONETICAS:
+        palabra = palabra.replace(antes, despues)
+    return re.sub(r"(.)\1+", r"\1", palabra)
+
+def forma_nombre(texto):
+    """(palabras plegadas, sus claves foneticas) de un nombre, con las palabras ordenadas
+    para que el orden de los apellidos no importe."""
+    palabras = sorted(plegar_nombre(texto).split())
+    return palabras, [clave_fonetica(p) for p in palabras]
+
+def claves_bloqueo(foneticas, palabras):
+    """Claves de bloqueo de un nombre: la clave fonética de cada palabra que no es partícula."""
+    return {f for f, p in zip(foneticas, palabras) if len(p) > 1 and p not in PARTICULAS_NOMBRE}
+
+def similitud(a, b, minimo=0.0):
+    """Ratio de difflib entre dos textos; 0 si las cotas rápidas ya quedan debajo de `minimo`."""
+    m = SequenceMatcher(None, a, b)
+    if m.real_quick_ratio() < minimo or m.quick_ratio() < minimo:
+        return 0.0
+    return m.ratio()
+
+def puntaje_nombre(consulta, candidato, parcial=False, umbral=0.0, memo=None):
+    """Similitud 0-1 entre dos formas de nombre: promedio de la letra plegada y de cómo suena.
+
+    Completo compara los nombres enteros con las palabras ordenadas; `parcial` (búsqueda
+    individual) toma, para cada palabra buscada, la palabra más parecida del candidato, y
+    cada una debe llegar a `umbral` por sí sola (un apellido exacto no arrastra a otra
+    palabra distinta). Un puntaje que ya no puede llegar a `umbral` se devuelve como 0.
+    `memo` guarda el puntaje de cada par de palabras, que se repiten mucho entre nombres.
+    """
+    (palabras_c, foneticas_c), (palabras_n, foneticas_n) = consulta, candidato
+    if not parcial:
+        if palabras_c == palabras_n:
+            return 1.0
+        letra = similitud(" ".join(palabras_c), " ".join(palabras_n), 2 * umbral - 1)
+        if letra < 2 * umbral - 1:
+            return 0.0
+        return (letra + similitud(" ".join(foneticas_c), " ".join(foneticas_n))) / 2
+    if not palabras_c or not palabras_n:
+        return 0.0
+    pares = {} if memo is None else memo.setdefault(("palabras",), {})
+    total = 0.0
+    for p, f in zip(palabras_c, foneticas_c):
+        mejor = 0.0
+        for q, g in zip(palabras_n, foneticas_n):
+            if (p, q) not in pares:
+                pares[(p, q)] = 1.0 if p == q else (similitud(p, q) + similitud(f, g)) / 2
+            mejor = max(mejor, pares[(p, q)])
+        if mejor < umbral:
+            return 0.0
+        total += mejor
+    return total / len(palabras_c)
+
+def agregar_indice_nombres(indice):
+    """Agrega al índice de trigramas de NOMBRE lo necesario para la búsqueda aproximada.
+
+    Cada valor distinto guarda su forma (palabras plegadas y foneticas) y sus claves de
+    bloqueo apuntan a los ids de valor; `filas_por_valor` lleva cada id a sus filas.
+    """
+    formas = [forma_nombre(v) for v in indice["valores"]]
+    bloques = {}
+    for id_valor, (palabras, foneticas) in enumerate(formas):
+        for clave in claves_bloqueo(foneticas, palabras):
+            bloques.setdefault(clave, []).append(id_valor)
+    bloques = {clave: np.array(ids, dtype=np.int32) for clave, ids in bloques.items()}
+    orden = np.argsort(indice["codigos"], kind="stable")
+    inicios = np.searchsorted(indice["codigos"][orden], np.arange(len(formas) + 1))
+    indice["nombres"] = {"formas": formas, "bloques": bloques, "orden": orden, "inicios": inicios}
+    indice["bytes"] += (orden.nbytes + inicios.nbytes + sys.getsizeof(bloques)
+                        + sum(sys.getsizeof(c) + ids.nbytes for c, ids in bloques.items())
+                        + sum(sys.getsizeof(p) + sys.getsizeof(f) for p, f in formas))
+
+def nombres_parecidos(indice, texto, umbral=UMBRAL_DIFUSO, parcial=False, memo=None):
+    """Ids de valor cuyo nombre se parece a `texto` y su puntaje: (ids, puntajes).
+
+    Solo se califican los candidatos que comparten claves de bloqueo con el texto: al menos
+    dos (o todas, si el texto tiene menos) en la búsqueda completa y al menos una en la parcial.
+    `memo` (un dict compartido entre hojas) guarda la forma de cada texto buscado, el
+    puntaje de cada par (texto, valor) y el de cada par de palabras para no recalcularlos.
+    """
+    nombres = indice["nombres"]
+    memo = {} if memo is None else memo
+    if texto not in memo:
+        forma = forma_nombre(texto)
+        memo[texto] = (forma, claves_bloqueo(forma[1], forma[0]))
+    consulta, claves = memo[texto]
+    listas = [nombres["bloques"][c] for c in claves if c in nombres["bloques"]]
+    minimo = 1 if parcial else min(2, len(claves))
+    if not listas or len(listas) < minimo:
+        return np.array([], dtype=np.int64), np.array([])
+    ids, veces = np.unique(np.concatenate(listas), return_counts=True)
+    ids = ids[veces >= minimo]
+    puntajes = np.empty(len(ids))
+    for n, i in enumerate(ids):
+        clave = (texto, indice["valores"][i])
+        if clave not in memo:
+            memo[clave] = puntaje_nombre(consulta, nombres["formas"][i], parcial, umbral, memo)
+        puntajes[n] = memo[clave]
+    return ids[puntajes >= umbral], puntajes[puntajes >= umbral]
+
+def filas_de_valores(indice, ids, puntajes):
+    """Filas (ordenadas) de los ids de valor dados y el puntaje de cada una."""
+    nombres = indice["nombres"]
+    tramos = [nombres["orden"][nombres["inicios"][i]:nombres["inicios"][i + 1]] for i in ids]
+    if not tramos:
+        return np.array([], dtype=np.int64), np.array([])
+    filas = np.concatenate(tramos)
+    puntaje_filas = np.repeat(puntajes, [len(t) for t in tramos])
+    orden = np.argsort(filas, kind="stable")
+    return filas[orden], puntaje_filas[orden]
+
+def indice_de_nombres(indices_hoja, df_upper, columna):
+    """Índice de nombres de la columna; si la hoja no lo trae precalculado se arma al momento."""
+    indice = indices_hoja.get(columna)
+    if indice is None or "nombres" not in indice:
+        indice = construir_indice_columna(df_upper[columna])
+        agregar_indice_nombres(indice)
+    return indice
+
+# =========================
+# Conjunto de datos listo para buscar
+# =========================
+def conjunto_vacio(version=0):
+    """Conjunto sin ningún libro listo (todos en "pendientes"), para usar antes de la primera carga."""
+    return {"version": version, "libros": {}, "normalizados": {}, "plan": {}, "indices": {}, "huellas": {},
+            "memoria": {}, "memoria_hojas": {}, "avisos": [], "pendientes": list(ARCHIVOS_LIBROS),
+            "medicion": nueva_medicion("carga", version=version)}
+
+def construir_conjunto(carpeta, version=1, max_procesos=None, medicion=None, anterior=None, al_libro=None):
+    """Carga los cinco libros de `carpeta` y arma sus copias normalizadas e índices.
+
+    Devuelve {"version", "libros", "normalizados", "plan", "indices", "huellas", "memoria",
+    "memoria_hojas", "avisos", "pendientes", "medicion"}; el conjunto es de solo lectura una
+    vez construido. Con el conjunto `anterior`, las hojas cuya huella no cambió reutilizan su
+    DataFrame, su copia normalizada, su plan y sus índices; solo se leen y preparan las nuevas
+    o modificadas. "memoria" da por libro (original, con tipos optimizados, copia normalizada,
+    índices) en bytes. La medición (la recibida o una nueva) queda con los tiempos de cada fase,
+    sin registrar.
+
+    Con `al_libro`, las hojas sin caché de todos los libros se parsean juntas en el pool y los
+    libros se preparan de uno en uno en el orden de ARCHIVOS_LIBROS, cada uno en cuanto
+    terminan las suyas; al terminar cada uno se llama `al_libro(libro, parcial)`, donde `parcial` es un conjunto con
+    los libros listos hasta ese momento y en "pendientes" los que faltan.
+    """
+    medicion = medicion if medicion is not None else nueva_medicion("carga")
+    medicion["version"] = version
+    rutas = rutas_libros(carpeta)
+    avisos = []
+    if al_libro is None:
+        with medir_fase(medicion, "lectura_excel"):
+            precargar_libros(list(rutas.values()), max_procesos=max_procesos, avisos=avisos)
+    else:
+        # Todas las hojas van juntas al pool; cada libro se prepara en cuanto terminan las suyas
+        precargas = precargar_por_libro(list(rutas.values()), max_procesos=max_procesos, avisos=avisos)
+    libros, normalizados, indices, plan, huellas, memoria_hojas = {}, {}, {}, {}, {}, {}
+
+    def armar(pendientes):
+        # Copias de primer nivel: el conjunto entregado no cambia al agregar más libros
+        # (original, con tipos optimizados, copia normalizada, índices) en bytes
+        memoria = {libro: tuple(sum(medida[i] for medida in hojas.values()) for i in (0, 1, 2))
+                          + (indices[libro]["bytes"] if libro in indices else 0,)
+                   for libro, hojas in memoria_hojas.items()}
+        return {"version": version, "libros": dict(libros), "normalizados": dict(normalizados),
+                "plan": dict(plan), "indices": dict(indices), "huellas": dict(huellas), "memoria": memoria,
+                "memoria_hojas": dict(memoria_hojas), "avisos": list(avisos), "pendientes": pendientes,
+                "medicion": medicion}
+
+    for posicion, (libro, ruta) in enumerate(rutas.items()):
+        if al_libro is not None:
+            with medir_fase(medicion, "lectura_excel"):
+                next(precargas)
+        previo = {clave: (anterior or {}).get(clave, {}).get(libro, {})
+                  for clave in ("libros", "normalizados", "plan", "huellas", "memoria_hojas")}
+        with medir_fase(medicion, "lectura_cache"):
+            hojas, huellas[libro] = cargar_datos(ruta, avisos, previo["huellas"])
+        libros[libro], normalizados[libro], plan[libro], memoria_hojas[libro] = {}, {}, {}, {}
+        indices_previos = {}
+        for hoja in huellas[libro]:
+            if hoja not in hojas:
+                # Misma huella que en el conjunto anterior: se reutiliza todo lo ya preparado
+                for destino, clave in ((libros, "libros"), (normalizados, "normalizados"),
+                                       (plan, "plan"), (memoria_hojas, "memoria_hojas")):
+                    destino[libro][hoja] = previo[clave][hoja]
+                indices_previos[hoja] = anterior["indices"][libro]["hojas"][hoja]
+                medir_hoja(medicion, libro=libro, hoja=hoja, filas=len(libros[libro][hoja]), reutilizada=True)
+                continue
+            inicio = time.perf_counter()
+            with medir_fase(medicion, "tipos"):
+                df = libros[libro][hoja] = optimizar_tipos(hojas[hoja])
+            with medir_fase(medicion, "plan"):
+                plan[libro][hoja] = planificar_hoja(df)
+            with medir_fase(medicion, "normalizacion"):
+                normalizados[libro][hoja] = normalizar_hoja(df)
+            memoria_hojas[libro][hoja] = (memoria_libro({hoja: hojas[hoja]}), memoria_libro({hoja: df}),
+                                          memoria_libro({hoja: normalizados[libro][hoja]}))
+            medir_hoja(medicion, libro=libro, hoja=hoja, filas=len(df), columnas=len(df.columns),
+                       segundos=time.perf_counter() - inicio, bytes=memoria_hojas[libro][hoja][1], reutilizada=False)
+        with medir_fase(medicion, "indices"):
+            indices[libro] = construir_indices_libro(normalizados[libro], plan[libro], indices_previos)
+        medicion["hojas_reutilizadas"] = sum(1 for hoja in medicion["hojas"] if hoja.get("reutilizada"))
+        if al_libro is not None:
+            al_libro(libro, armar(list(rutas)[posicion + 1:]))
+    conjunto = armar([])
+    for libro, (antes, despues, normalizada, bytes_indices) in conjunto["memoria"].items():
+        log.info("%s: %.1f MB -> %.1f MB tras optimizar tipos; %.1f MB en total con copia normalizada (%.1f MB) "
+                 "e índices (%.1f MB)", libro, antes / 1024**2, despues / 1024**2,
+                 (despues + normalizada + bytes_indices) / 1024**2, normalizada / 1024**2, bytes_indices / 1024**2)
+    return conjunto
+
+# =========================
+# Función de búsqueda individual optimizada con NumPy
+# =========================
+TAMANO_BLOQUE = 100_000  # filas candidatas que se revisan a la vez con str.contains
+
+def filas_coincidentes(df_upper, indices_hoja, criterios, max_coincidencias=None, mascara=None):
+    """Posiciones de las filas que contienen todos los criterios [(columna, valor normalizado)].
+
+    Primero se aplican los criterios que resuelve el índice de trigramas; los demás se
+    revisan con `str.contains` solo sobre las filas candidatas, por bloques, y la revisión
+    se detiene en cuanto se juntan `max_coincidencias` filas. `mascara` limita de antemano
+    las filas candidatas.
+    """
+    mask = np.ones(len(df_upper), dtype=bool) if mascara is None else mascara.copy()
+    por_revisar = []
+    for col, val in criterios:
+        encontrados = buscar_en_indice(indices_hoja[col], val) if col in indices_hoja else None
+        if encontrados is None:
+            por_revisar.append((col, val))
+        else:
+            mask &= encontrados
+    candidatos = np.flatnonzero(mask)
+    if not por_revisar:
+        return candidatos[:max_coincidencias]
+
+    filas, total = [], 0
+    for inicio in range(0, len(candidatos), TAMANO_BLOQUE):
+        bloque = candidatos[inicio:inicio + TAMANO_BLOQUE]
+        for col, val in por_revisar:
+            bloque = bloque[df_upper[col].iloc[bloque].str.contains(val, na=False).to_numpy()]
+        filas.append(bloque)
+        total += len(bloque)
+        if max_coincidencias and total >= max_coincidencias:
+            break
+    return np.concatenate(filas)[:max_coincidencias] if filas else candidatos
+
+def buscar_datos_todos_libros(todos_los_libros, valores, asunto="", columna_especifica="", valor_especifico="",
+                              normalizados=None, indices=None, progreso=None, max_coincidencias=None,
+                              medicion=None, plan=None, difuso=False, umbral=UMBRAL_DIFUSO):
+    """Búsqueda parcial (contiene) en todas las hojas: {"[LIBRO - ]hoja": filas encontradas}.
+
+    Las columnas de los criterios se buscan en el `plan` (sin acentos y con alias); las hojas
+    a las que les falta alguna se descartan sin revisarlas. Con `max_coincidencias` cada hoja
+    deja de revisarse al llegar a ese número de filas. Con `difuso` el NOMBRE se compara de
+    forma aproximada (ver `nombres_parecidos`) y los resultados traen la columna PUNTAJE_NOMBRE.
+    """
+    res = {}
+    total_hojas = sum([len(libro) for libro in todos_los_libros.values()])
+    hoja_idx = 0
+    with medir_fase(medicion, "plan"):
+        plan = plan or planificar_conjunto(todos_los_libros)
+
+    # Búsqueda exacta o parcial: criterios como (columna canónica, valor normalizado)
+    if columna_especifica and valor_especifico:
+        criterios_plan = [(clave_columna(columna_especifica), valor_especifico.strip().upper())]
+    else:
+        criterios_plan = [(clave_columna(k), str(v).strip().upper()) for k, v in valores.items() if v]
+    asunto_upper = asunto.strip().upper() if asunto and not (columna_especifica and valor_especifico) else ""
+    nombre_difuso = next((val for clave, val in criterios_plan if clave == "NOMBRE"), "") if difuso else ""
+    memo = {}  # formas y puntajes de nombres, compartidos por todas las hojas
+    podadas, consultadas = [], set()
+
+    for libro_nombre, libro_dict in todos_los_libros.items():
+        for hoja, df in libro_dict.items():
+            hoja_idx += 1
+            if progreso:
+                progreso(min(1.0, hoja_idx/total_hojas))
+            columnas_hoja = plan[libro_nombre][hoja]["columnas"]
+            if df.empty or any(clave not in columnas_hoja for clave, _ in criterios_plan):
+                podadas.append(f"{libro_nombre} - {hoja}")
+                continue
+            criterios = [(columnas_hoja[clave], val) for clave, val in criterios_plan
+                         if not (nombre_difuso and clave == "NOMBRE")]
+            if asunto_upper and "ASUNTO" in columnas_hoja:
+                criterios.append((columnas_hoja["ASUNTO"], asunto_upper))
+            usadas = [col for col, _ in criterios] + ([columnas_hoja["NOMBRE"]] if nombre_difuso else [])
+            consultadas.update(usadas)
+
+            inicio = time.perf_counter()
+            df_upper = (normalizados or {}).get(libro_nombre, {}).get(hoja)
+            if df_upper is None:
+                # Sin copia normalizada solo se normalizan las columnas de los criterios
+                with medir_fase(medicion, "normalizacion"):
+                    df_upper = normalizar_hoja(df[list(dict.fromkeys(usadas))])
+            indices_hoja = (indices or {}).get(libro_nombre, {}).get("hojas", {}).get(hoja, {})
+
+            mascara, puntajes = None, None
+            if nombre_difuso:
+                with medir_fase(medicion, "nombres_aproximados"):
+                    indice = indice_de_nombres(indices_hoja, df_upper, columnas_hoja["NOMBRE"])
+                    filas_nombre, puntajes_nombre = filas_de_valores(
+                        indice, *nombres_parecidos(indice, nombre_difuso, umbral, parcial=True, memo=memo))
+                    mascara = np.zeros(len(df), dtype=bool)
+                    mascara[filas_nombre] = True
+                    puntajes = np.zeros(len(df))
+                    puntajes[filas_nombre] = puntajes_nombre
+            with medir_fase(medicion, "filtro"):
+                filas = filas_coincidentes(df_upper, indices_hoja, criterios, max_coincidencias, mascara)
+            bytes_resultado = 0
+            if len(filas):
+                prefijo = "" if libro_nombre=="CONTROL" else f"{libro_nombre} - "
+                with medir_fase(medicion, "extraccion"):
+                    res[f"{prefijo}{hoja}"] = df.iloc[filas]
+                    if puntajes is not None:
+                        res[f"{prefijo}{hoja}"] = res[f"{prefijo}{hoja}"].assign(PUNTAJE_NOMBRE=puntajes[filas].round(3))
+                bytes_resultado = memoria_resultados({hoja: res[f"{prefijo}{hoja}"]}) if medicion is not None else 0
+            medir_hoja(medicion, libro=libro_nombre, hoja=hoja, filas=len(df), coincidencias=len(filas),
+                       segundos=time.perf_counter() - inicio, bytes=bytes_resultado)
+
+    anotar_plan(medicion, total_hojas, podadas, consultadas)
+    return res
+
+# =========================
+# Caché LRU de resultados de la búsqueda individual
+# =========================
+MAX_ENTRADAS_CACHE = 256
+MAX_BYTES_CACHE = 256 * 1024**2  # resultados más grandes que esto no se guardan
+
+def nueva_cache_resultados(max_entradas=MAX_ENTRADAS_CACHE, max_bytes=MAX_BYTES_CACHE):
+    """Caché de resultados compartible entre hilos: las entradas menos usadas salen primero."""
+    return {"entradas": OrderedDict(), "max_entradas": max_entradas, "max_bytes": max_bytes, "bytes": 0,
+            "version": None, "aciertos": 0, "fallos": 0, "descartes": 0, "invalidaciones": 0,
+            "candado": threading.Lock()}
+
+def clave_busqueda(version, valores, asunto="", columna_especifica="", valor_especifico="",
+                   max_coincidencias=None, difuso=False, umbral=UMBRAL_DIFUSO):
+    """Clave de una búsqueda individual con los criterios normalizados como en
+    `buscar_datos_todos_libros`, de modo que búsquedas equivalentes compartan resultados."""
+    if columna_especifica and valor_especifico:
+        criterios = ((clave_columna(columna_especifica), valor_especifico.strip().upper()),)
+        asunto = ""
+    else:
+        criterios = tuple(sorted((clave_columna(k), str(v).strip().upper()) for k, v in valores.items() if v))
+    return (version, criterios, asunto.strip().upper() if asunto else "", max_coincidencias or None,
+            umbral if difuso else None)
+
+def buscar_con_cache(cache, clave, buscar, medicion=None):
+    """Resultados de `clave` desde la caché o, si no están, los de `buscar()`, que se guardan.
+
+    Una clave con una versión de datos más nueva vacía la caché; una con versión anterior se
+    busca sin pasar por ella. Los resultados guardados se comparten entre sesiones y no deben
+    modificarse.
+    """
+    with cache["candado"]:
+        if cache["version"] is None or clave[0] > cache["version"]:
+            if cache["entradas"]:
+                cache["invalidaciones"] += 1
+            cache["entradas"].clear()
+            cache["bytes"], cache["version"] = 0, clave[0]
+        elif clave[0] < cache["version"]:
+            return buscar()
+        if clave in cache["entradas"]:
+            cache["entradas"].move_to_end(clave)
+            cache["aciertos"] += 1
+            if medicion is not None:
+                medicion["cache"] = "acierto"
+            return cache["entradas"][clave][0]
+        cache["fallos"] += 1
+    if medicion is not None:
+        medicion["cache"] = "fallo"
+    resultados = buscar()
+    tamano = memoria_resultados(resultados)
+    with cache["candado"]:
+        if cache["version"] != clave[0] or tamano > cache["max_bytes"] or clave in cache["entradas"]:
+            return resultados
+        cache["entradas"][clave] = (resultados, tamano)
+        cache["bytes"] += tamano
+        while len(cache["entradas"]) > cache["max_entradas"] or cache["bytes"] > cache["max_bytes"]:
+            _, (_, liberados) = cache["entradas"].popitem(last=False)
+            cache["bytes"] -= liberados
+            cache["descartes"] += 1
+    return resultados
+
+def estadisticas_cache(cache):
+    """{"entradas", "bytes", "aciertos", "fallos", "tasa_aciertos", "descartes", "invalidaciones"}."""
+    with cache["candado"]:
+        consultas = cache["aciertos"] + cache["fallos"]
+        return {"entradas": len(cache["entradas"]), "bytes": cache["bytes"], "aciertos": cache["aciertos"],
+                "fallos": cache["fallos"], "tasa_aciertos": cache["aciertos"] / consultas if consultas else 0.0,
+                "descartes": cache["descartes"], "invalidaciones": cache["invalidaciones"]}
+
+# =========================
+# Cruce por hash entre la plantilla masiva y cada hoja
+# =========================
+def agrupar_plantilla(df_busqueda_norm):
+    """Agrupa las filas de la plantilla según las columnas que traen valor: {(col, ...): [posiciones]}."""
+    grupos = {}
+    columnas = list(df_busqueda_norm.columns)
+    for pos, llenas in enumerate(df_busqueda_norm.ne("").to_numpy()):
+        clave = tuple(col for col, llena in zip(columnas, llenas) if llena)
+        grupos.setdefault(clave, []).append(pos)
+    return grupos
+
+BLOQUE_PLANTILLA = 1000  # filas de plantilla por bloque cuando hay tope de coincidencias
+
+def llave_hoja(serie_norm):
+    """Llave de cruce de una columna normalizada sin pasarla a objetos: sus códigos o su arreglo de Arrow."""
+    if isinstance(serie_norm.dtype, pd.CategoricalDtype):
+        return serie_norm.cat.codes.to_numpy()
+    return serie_norm.array
+
+def llave_plantilla(serie_norm, valores):
+    """Valores de la plantilla expresados como la llave de `serie_norm` (-1 si la categoría no existe)."""
+    if isinstance(serie_norm.dtype, pd.CategoricalDtype):
+        return serie_norm.cat.categories.get_indexer(valores)
+    return pd.array(valores, dtype=serie_norm.dtype)
+
+def cruzar_plantilla_hoja(df_busqueda_norm, grupos, df_hoja_norm, max_filas=None, columnas_hoja=None,
+                          devolver_orden=False):
+    """Devuelve las posiciones de la hoja que coinciden con la plantilla.
+
+    Cada grupo de filas de la plantilla se cruza con la hoja mediante un merge (hash join)
+    sobre sus columnas llenas. El orden final es el de la búsqueda fila por fila: primero
+    por fila de plantilla y después por fila de hoja, con una posición por cada par.
+    Con `max_filas` la plantilla se cruza por bloques, en orden, y el cruce se detiene en
+    cuanto se juntan esas filas. `columnas_hoja` lleva cada columna de la plantilla a la
+    columna de la hoja con la que se compara (por defecto, la del mismo nombre). Con
+    `devolver_orden` se devuelve también la fila de plantilla de cada posición: (filas, ordenes).
+    """
+    if columnas_hoja is None:
+        columnas_hoja = {col: col for col in df_busqueda_norm.columns if col in df_hoja_norm.columns}
+    filas_hoja = np.arange(len(df_hoja_norm))
+    grupos = {columnas: np.asarray(posiciones) for columnas, posiciones in grupos.items()
+              if all(col in columnas_hoja for col in columnas)}
+    derechas = {}
+    tamano = BLOQUE_PLANTILLA if max_filas else max(1, len(df_busqueda_norm))
+    resultado, ordenes_resultado, total = [], [], 0
+    for desde in range(0, len(df_busqueda_norm), tamano):
+        ordenes, filas = [], []
+        for columnas, posiciones in grupos.items():
+            posiciones = posiciones[np.searchsorted(posiciones, desde):np.searchsorted(posiciones, desde + tamano)]
+            if not len(posiciones):
+                continue
+            if not columnas:
+                # Fila de plantilla vacía: coincide con todas las filas de la hoja
+                ordenes.append(np.repeat(posiciones, len(filas_hoja)))
+                filas.append(np.tile(filas_hoja, len(posiciones)))
+                continue
+            llaves = [f"_llave{i}" for i in range(len(columnas))]
+            izquierda = pd.DataFrame({llave: llave_plantilla(df_hoja_norm[columnas_hoja[col]],
+                                                             df_busqueda_norm[col].to_numpy(dtype=object)[posiciones])
+                                      for llave, col in zip(llaves, columnas)})
+            izquierda["_orden"] = posiciones
+            if columnas not in derechas:
+                derechas[columnas] = pd.DataFrame({llave: llave_hoja(df_hoja_norm[columnas_hoja[col]])
+                                                   for llave, col in zip(llaves, columnas)})
+                derechas[columnas]["_fila"] = filas_hoja
+            pares = izquierda.merge(derechas[columnas], on=llaves, how="inner", sort=False)
+            ordenes.append(pares["_orden"].to_numpy())
+            filas.append(pares["_fila"].to_numpy())
+        if filas:
+            ordenes = np.concatenate(ordenes)
+            filas = np.concatenate(filas)
+            orden = np.lexsort((filas, ordenes))
+            resultado.append(filas[orden])
+            ordenes_resultado.append(ordenes[orden])
+            total += len(resultado[-1])
+        if max_filas and total >= max_filas:
+            break
+
+    if not resultado:
+        vacio = np.array([], dtype=np.int64)
+        return (vacio, vacio) if devolver_orden else vacio
+    if devolver_orden:
+        return np.concatenate(resultado)[:max_filas], np.concatenate(ordenes_resultado)[:max_filas]
+    return np.concatenate(resultado)[:max_filas]
+
+def cruzar_plantilla_difuso(df_busqueda_norm, grupos, df_hoja_norm, columnas_hoja, col_nombre, indice,
+                            umbral=UMBRAL_DIFUSO, max_filas=None, memo=None):
+    """Como `cruzar_plantilla_hoja`, pero el nombre de la plantilla (`col_nombre`) se compara
+    de forma aproximada.
+
+    Cada nombre distinto de la plantilla se busca una vez en el índice de nombres de la hoja
+    y su fila de plantilla se repite con cada valor parecido que se encontró; esa plantilla
+    ampliada se cruza exacta con las demás columnas llenas. El orden es el mismo que el de
+    la búsqueda exacta y las filas sin nombre conservan el cruce exacto (puntaje 1).
+    Devuelve (filas, puntajes, ordenes) con la fila de plantilla de cada posición.
+    """
+    nombres = df_busqueda_norm[col_nombre].to_numpy()
+    parecidos = {}
+    origen, valores, puntajes = [], [], []
+    for columnas, posiciones in grupos.items():
+        if not all(col in columnas_hoja for col in columnas):
+            continue
+        for pos in posiciones:
+            if col_nombre not in columnas:
+                origen.append(pos)
+                valores.append(nombres[pos])
+                puntajes.append(1.0)
+                continue
+            if nombres[pos] not in parecidos:
+                ids, puntajes_ids = nombres_parecidos(indice, nombres[pos], umbral, memo=memo)
+                parecidos[nombres[pos]] = (indice["valores"][ids], puntajes_ids)
+            parecidos_pos, puntajes_pos = parecidos[nombres[pos]]
+            origen.extend([pos] * len(parecidos_pos))
+            valores.extend(parecidos_pos)
+            puntajes.extend(puntajes_pos)
+    if not origen:
+        return np.array([], dtype=np.int64), np.array([]), np.array([], dtype=np.int64)
+    origen = np.asarray(origen)
+    ampliada = df_busqueda_norm.iloc[origen].reset_index(drop=True)
+    ampliada[col_nombre] = valores
+    filas, ordenes = cruzar_plantilla_hoja(ampliada, agrupar_plantilla(ampliada), df_hoja_norm,
+                                           columnas_hoja=columnas_hoja, devolver_orden=True)
+    orden = np.lexsort((filas, origen[ordenes]))
+    return filas[orden][:max_filas], np.asarray(puntajes)[ordenes][orden][:max_filas], origen[ordenes][orden][:max_filas]
+
+# =========================
+# Cruce masivo en paralelo por particiones (hoja, bloque de filas)
+# =========================
+# Los procesos no reciben las hojas serializadas: leen la copia normalizada desde un
+# archivo Arrow sin comprimir con memory-map, solo las columnas y filas de su partición.
+# Esas copias traen RFC, nombres y cuentas: viven junto a la caché columnar de los libros,
+# en una carpeta que solo puede leer el usuario del servidor.
+MAX_PROCESOS_BUSQUEDA = os.cpu_count() or 1
+FILAS_POR_PARTICION = 100_000
+HORAS_PARTICIONES = 24  # los archivos de huellas que ya no se usan se borran tras este tiempo
+MIN_FILAS_PARALELO = 500_000  # con menos filas en los libros, arrancar el cruce en paralelo no compensa
+PLANTILLA_PROCESO = {}  # dentro de cada proceso del pool: última plantilla leída y sus grupos
+POOL_BUSQUEDA = {}  # {"pool", "procesos"} del proceso del servidor
+candado_pool = threading.Lock()
+
+def carpeta_particiones(carpeta):
+    """Carpeta de las copias normalizadas para el cruce en paralelo: `.cache_columnar/particiones/`."""
+    return os.path.join(carpeta, ".cache_columnar", "particiones")
+
+def arrow_normalizada(df_upper, huella, carpeta):
+    """Ruta del archivo Arrow con la copia normalizada de una hoja de los libros de
+    `carpeta`, escrito la primera vez (carpeta 700, archivo 600).
+
+    El archivo se nombra por la huella de la hoja, así que sirve mientras la hoja no cambie.
+    Devuelve None si la hoja no se puede guardar así (por ejemplo, encabezados repetidos al
+    pasarlos a texto).
+    """
+    destino = carpeta_particiones(carpeta)
+    ruta = os.path.join(destino, f"normalizada_{huella[:32]}.arrow")
+    if os.path.exists(ruta):
+        os.utime(ruta)  # la fecha marca el último uso, para la limpieza
+        return ruta
+    columnas = [str(col) for col in df_upper.columns]
+    if len(set(columnas)) != len(columnas):
+        return None
+    try:
+        carpeta_privada(destino)
+        tabla = pa.Table.from_pandas(df_upper.set_axis(columnas, axis=1), preserve_index=False)
+        temporal = nombre_temporal(ruta)
+        feather.write_feather(tabla, temporal, compression="uncompressed")
+        os.chmod(temporal, 0o600)
+        os.replace(temporal, ruta)
+    except (OSError, pa.ArrowException) as e:
+        log.warning("No se pudo escribir la partición de %s: %s", huella[:12], e)
+        return None
+    limite = time.time() - HORAS_PARTICIONES * 3600
+    for archivo in os.listdir(destino):
+        vieja = os.path.join(destino, archivo)
+        try:
+            if vieja != ruta and os.path.getmtime(vieja) < limite:
+                os.remove(vieja)
+        except OSError:
+            pass
+    return ruta
+
+def pool_busqueda(procesos):
+    """Pool del cruce masivo: uno por proceso del servidor, reutilizado entre búsquedas.
+
+    Solo se vuelve a crear si cambia el número de procesos o si se descartó por un error.
+    """
+    with candado_pool:
+        if POOL_BUSQUEDA.get("procesos") != procesos:
+            if POOL_BUSQUEDA.get("pool") is not None:
+                POOL_BUSQUEDA["pool"].shutdown(wait=False)
+            POOL_BUSQUEDA.update(pool=ProcessPoolExecutor(max_workers=procesos), procesos=procesos)
+        return POOL_BUSQUEDA["pool"]
+
+def descartar_pool(pool):
+    """Saca del uso un pool roto; la siguiente búsqueda en paralelo crea otro."""
+    with candado_pool:
+        if POOL_BUSQUEDA.get("pool") is pool:
+            POOL_BUSQUEDA.clear()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def arrow_plantilla(df_busqueda_norm, carpeta):
+    """Escribe la plantilla normalizada de una búsqueda para los procesos del pool (archivo 600).
+
+    Devuelve None si sus encabezados no se pueden pasar a texto sin repetirse.
+    """
+    columnas = [str(col) for col in df_busqueda_norm.columns]
+    if len(set(columnas)) != len(columnas):
+        return None
+    destino = carpeta_particiones(carpeta)
+    os.makedirs(destino, mode=0o700, exist_ok=True)
+    ruta = os.path.join(destino, f"plantilla_{os.getpid()}_{threading.get_ident()}_{time.time_ns()}.arrow")
+    tabla = pa.Table.from_pandas(df_busqueda_norm.set_axis(columnas, axis=1), preserve_index=False)
+    feather.write_feather(tabla, ruta + ".tmp", compression="uncompressed")
+    os.chmod(ruta + ".tmp", 0o600)
+    os.replace(ruta + ".tmp", ruta)
+    return ruta
+
+def cruzar_particion(ruta_plantilla, ruta_arrow, columnas_hoja, inicio, cantidad, max_filas):
+    """En un proceso del pool: cruza la plantilla con las filas [inicio, inicio + cantidad) de
+    una hoja normalizada. Devuelve (filas de la hoja, filas de plantilla, segundos).
+
+    La plantilla se lee una vez por búsqueda y proceso, desde su archivo Arrow.
+    """
+    comienzo = time.perf_counter()
+    if PLANTILLA_PROCESO.get("ruta") != ruta_plantilla:
+        plantilla = feather.read_table(ruta_plantilla).to_pandas()
+        PLANTILLA_PROCESO.update(ruta=ruta_plantilla, plantilla=plantilla, grupos=agrupar_plantilla(plantilla))
+    tabla = feather.read_table(ruta_arrow, columns=list(dict.fromkeys(columnas_hoja.values())), memory_map=True)
+    df_bloque = tabla.slice(inicio, cantidad).to_pandas()
+    filas, ordenes = cruzar_plantilla_hoja(PLANTILLA_PROCESO["plantilla"], PLANTILLA_PROCESO["grupos"], df_bloque,
+                                           max_filas, columnas_hoja, devolver_orden=True)
+    return filas + inicio, ordenes, time.perf_counter() - comienzo
+
+def cruzar_en_serie(paralelas, df_busqueda_norm, grupos, max_filas, normalizados):
+    """Cruce en el proceso actual de las hojas de `paralelas`, con sus copias de `normalizados`."""
+    cruces = {}
+    for (libro, hoja), (_, _, columnas_hoja) in paralelas.items():
+        inicio = time.perf_counter()
+        filas, ordenes = cruzar_plantilla_hoja(df_busqueda_norm, grupos, normalizados[libro][hoja], max_filas,
+                                               columnas_hoja, devolver_orden=True)
+        cruces[(libro, hoja)] = (filas, None, ordenes, time.perf_counter() - inicio)
+    return cruces
+
+def cruzar_en_paralelo(paralelas, df_busqueda_norm, grupos, max_filas=None, procesos=None, normalizados=None,
+                       carpeta=None):
+    """Cruza la plantilla con las hojas de `paralelas` ({(libro, hoja): (ruta Arrow, filas,
+    columnas_hoja)}) repartiendo bloques de FILAS_POR_PARTICION filas en el pool de procesos.
+
+    Devuelve {(libro, hoja): (filas, None, ordenes, segundos)} con los pares ordenados por fila
+    de plantilla y luego por fila de hoja, como `cruzar_plantilla_hoja`. Si el pool no se
+    puede usar se cruza en serie con las copias de `normalizados`.
+    """
+    procesos = MAX_PROCESOS_BUSQUEDA if procesos is None else procesos
+    tareas = [(clave, inicio, min(FILAS_POR_PARTICION, total - inicio))
+              for clave, (_, total, _) in paralelas.items() for inicio in range(0, max(total, 1), FILAS_POR_PARTICION)]
+    partes = {clave: [] for clave in paralelas}
+    ruta_plantilla, pool = None, None
+    try:
+        ruta_plantilla = arrow_plantilla(df_busqueda_norm, carpeta)
+        if ruta_plantilla is None:
+            return cruzar_en_serie(paralelas, df_busqueda_norm, grupos, max_filas, normalizados)
+        pool = pool_busqueda(procesos)
+        futuros = [(clave, pool.submit(cruzar_particion, ruta_plantilla, paralelas[clave][0],
+                                       {str(col): str(real) for col, real in paralelas[clave][2].items()},
+                                       inicio, cantidad, max_filas))
+                   for clave, inicio, cantidad in tareas]
+        for clave, futuro in futuros:
+            partes[clave].append(futuro.result())
+    except Exception as e:
+        # Pool roto o no disponible: se repite el cruce en el proceso actual
+        log.warning("Cruce en paralelo no disponible (%s); se cruza en serie", e)
+        if pool is not None:
+            descartar_pool(pool)
+        return cruzar_en_serie(paralelas, df_busqueda_norm, grupos, max_filas, normalizados)
+    finally:
+        if ruta_plantilla is not None and os.path.exists(ruta_plantilla):
+            os.remove(ruta_plantilla)
+
+    cruces = {}
+    for clave, resultados in partes.items():
+        filas = np.concatenate([parte[0] for parte in resultados]).astype(np.int64)
+        ordenes = np.concatenate([parte[1] for parte in resultados]).astype(np.int64)
+        orden = np.lexsort((filas, ordenes))[:max_filas]
+        cruces[clave] = (filas[orden], None, ordenes[orden], sum(parte[2] for parte in resultados))
+    return cruces
+
+# =========================
+# Función de búsqueda masiva optimizada sin desconfigurar
+# =========================
+def buscar_masivo_todos_libros(todos_los_libros, df_busqueda, normalizados=None, progreso=None,
+                               max_coincidencias=None, medicion=None, plan=None, indices=None,
+                               difuso=False, umbral=UMBRAL_DIFUSO, encontradas=None, procesos=1, huellas=None,
+                               carpeta=None):
+    """Búsqueda exacta de cada fila de la plantilla en todas las hojas: {"LIBRO - hoja": filas}.
+
+    Los encabezados de la plantilla se emparejan con los de cada hoja mediante el `plan`
+    (sin acentos y con alias); las hojas donde ninguna fila de la plantilla puede coincidir
+    se descartan sin revisarlas. Con `max_coincidencias` cada hoja deja de cruzarse al
+    llegar a ese número de filas. Con `difuso` el NOMBRE se compara de forma aproximada
+    (usando los índices de nombres de `indices`) y los resultados traen PUNTAJE_NOMBRE.
+    Si se pasa el conjunto `encontradas`, se le agregan las posiciones de las filas de la
+    plantilla que coincidieron en alguna hoja.
+
+    Con `procesos` > 1, las `huellas` del conjunto y la `carpeta` de los libros, las hojas de
+    cruce exacto se reparten por bloques de filas en un pool de procesos (ver
+    `cruzar_en_paralelo`); el resultado es el mismo que en serie. Si los libros suman menos
+    de MIN_FILAS_PARALELO filas se cruza en serie de todos modos.
+    """
+    resultados_combinados = {}
+    total_hojas = sum([len(libro) for libro in todos_los_libros.values()])
+    hoja_idx = 0
+    if sum(len(df) for libro in todos_los_libros.values() for df in libro.values()) < MIN_FILAS_PARALELO:
+        procesos = 1
+    with medir_fase(medicion, "plan"):
+        plan = plan or planificar_conjunto(todos_los_libros)
+
+    with medir_fase(medicion, "plantilla"):
+        df_busqueda = normalizar_hoja(df_busqueda)
+        grupos = agrupar_plantilla(df_busqueda)
+    if medicion is not None:
+        medicion["filas_plantilla"] = len(df_busqueda)
+    claves_plantilla = {col: clave_columna(col) for col in df_busqueda.columns}
+    col_nombre = next((col for col, clave in claves_plantilla.items() if clave == "NOMBRE"), None) if difuso else None
+    memo = {}
+    podadas, consultadas = [], set()
+    cruces, paralelas = {}, {}  # (libro, hoja) -> (filas, puntajes, ordenes, segundos) / partición pendiente
+
+    for libro_nombre, libro_dict in todos_los_libros.items():
+        for hoja, df_hoja in libro_dict.items():
+            hoja_idx += 1
+            if progreso:
+                progreso(min(1.0, hoja_idx/total_hojas))
+            columnas_plan = plan[libro_nombre][hoja]["columnas"]
+            columnas_hoja = {col: columnas_plan[clave] for col, clave in claves_plantilla.items()
+                             if clave in columnas_plan}
+            aplicables = [columnas for columnas in grupos if all(col in columnas_hoja for col in columnas)]
+            if df_hoja.empty or not aplicables:
+                podadas.append(f"{libro_nombre} - {hoja}")
+                continue
+            usadas = [columnas_hoja[col] for columnas in aplicables for col in columnas]
+            consultadas.update(usadas)
+
+            inicio = time.perf_counter()
+            df_hoja_upper = (normalizados or {}).get(libro_nombre, {}).get(hoja)
+            if df_hoja_upper is None:
+                # Sin copia normalizada solo se normalizan las columnas que se cruzan
+                with medir_fase(medicion, "normalizacion"):
+                    df_hoja_upper = normalizar_hoja(df_hoja[list(dict.fromkeys(usadas))])
+            elif (procesos > 1 and carpeta and col_nombre not in columnas_hoja
+                  and hoja in (huellas or {}).get(libro_nombre, {})):
+                # Se cruza después en el pool, por bloques de filas, desde su archivo Arrow
+                with medir_fase(medicion, "particiones"):
+                    ruta_arrow = arrow_normalizada(df_hoja_upper, huellas[libro_nombre][hoja], carpeta)
+                if ruta_arrow is not None:
+                    paralelas[(libro_nombre, hoja)] = (ruta_arrow, len(df_hoja_upper), columnas_hoja)
+                    continue
+
+            # Una fila de resultado por cada par (fila de plantilla, fila de hoja) que coincide
+            puntajes = None
+            if col_nombre in columnas_hoja:
+                with medir_fase(medicion, "nombres_aproximados"):
+                    indices_hoja = (indices or {}).get(libro_nombre, {}).get("hojas", {}).get(hoja, {})
+                    indice = indice_de_nombres(indices_hoja, df_hoja_upper, columnas_hoja[col_nombre])
+                    filas, puntajes, ordenes = cruzar_plantilla_difuso(df_busqueda, grupos, df_hoja_upper, columnas_hoja,
+                                                                       col_nombre, indice, umbral, max_coincidencias, memo)
+            else:
+                with medir_fase(medicion, "cruce"):
+                    filas, ordenes = cruzar_plantilla_hoja(df_busqueda, grupos, df_hoja_upper, max_coincidencias,
+                                                           columnas_hoja, devolver_orden=True)
+            cruces[(libro_nombre, hoja)] = (filas, puntajes, ordenes, time.perf_counter() - inicio)
+
+    if paralelas:
+        with medir_fase(medicion, "cruce_paralelo"):
+            cruces.update(cruzar_en_paralelo(paralelas, df_busqueda, grupos, max_coincidencias, procesos,
+                                             normalizados, carpeta))
+        if medicion is not None:
+            medicion["procesos"] = procesos
+
+    # Resultados en el orden de los libros y sus hojas, sin importar dónde se cruzaron
+    for libro_nombre, libro_dict in todos_los_libros.items():
+        for hoja, df_hoja in libro_dict.items():
+            if (libro_nombre, hoja) not in cruces:
+                continue
+            filas, puntajes, ordenes, segundos = cruces[(libro_nombre, hoja)]
+            if encontradas is not None:
+                encontradas.update(np.unique(ordenes).tolist())
+            bytes_resultado = 0
+            if len(filas):
+                clave = f"{libro_nombre} - {hoja}"
+                with medir_fase(medicion, "extraccion"):
+                    resultados_combinados[clave] = df_hoja.iloc[filas].reset_index(drop=True)
+                    if puntajes is not None:
+                        resultados_combinados[clave]["PUNTAJE_NOMBRE"] = puntajes.round(3)
+                bytes_resultado = memoria_resultados({clave: resultados_combinados[clave]}) if medicion is not None else 0
+            medir_hoja(medicion, libro=libro_nombre, hoja=hoja, filas=len(df_hoja), coincidencias=len(filas),
+                       segundos=segundos, bytes=bytes_resultado)
+
+    anotar_plan(medicion, total_hojas, podadas, consultadas)
+    return resultados_combinados
+
+# =========================
+# Nombres de hoja para exportar resultados
+# =========================
+CARACTERES_INVALIDOS_HOJA = set('[]:*?/\\')
+
+def nombre_hoja_excel(clave, usados):
+    """Nombre de hoja válido para Excel (31 caracteres, sin []:*?/\\) y distinto de los `usados`."""
+    base = "".join("_" if c in CARACTERES_INVALIDOS_HOJA else c for c in str(clave))[:31] or "Hoja"
+    nombre, n = base, 1
+    while nombre.upper() in usados:
+        n += 1
+        sufijo = f" ({n})"
+        nombre = base[:31 - len(sufijo)] + sufijo
+    usados.add(nombre.upper())
+    return nombre
+
+# =========================
+# Exportación de resultados a Excel por streaming
+# =========================
+HOJA_SIN_COINCIDENCIAS = "SIN COINCIDENCIAS"
+FILAS_POR_BLOQUE_EXCEL = 10_000  # filas que se convierten a la vez antes de escribirse
+
+def escribir_hoja_streaming(hoja, df):
+    """Agrega a una hoja de solo escritura el encabezado y las filas de `df`, por bloques.
+
+    Los vacíos (NaN, NaT, pd.NA) se escriben como celdas vacías.
+    """
+    hoja.append([str(col) for col in df.columns])
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE_EXCEL):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE_EXCEL].astype(object)
+        for fila in bloque.where(bloque.notna(), None).itertuples(index=False, name=None):
+            hoja.append(fila)
+
+def exportar_resultados_excel(resultados, destino, df_busqueda=None, encontradas=None):
+    """Escribe los resultados en un .xlsx sin armar el libro en memoria (openpyxl write-only).
+
+    Con la plantilla `df_busqueda` y las posiciones `encontradas` (ver
+    `buscar_masivo_todos_libros`) la primera hoja lista las filas de la plantilla que no
+    coincidieron en ninguna hoja, con su número de fila en el Excel de la plantilla. Después
+    va una hoja por cada clave de `resultados`. `destino` es una ruta o un archivo binario.
+    """
+    libro = Workbook(write_only=True)
+    usados = set()
+    if df_busqueda is not None:
+        sin_coincidencia = [pos for pos in range(len(df_busqueda)) if pos not in (encontradas or set())]
+        resumen = df_busqueda.iloc[sin_coincidencia].copy()
+        resumen.insert(0, "FILA PLANTILLA", [pos + 2 for pos in sin_coincidencia])
+        escribir_hoja_streaming(libro.create_sheet(nombre_hoja_excel(HOJA_SIN_COINCIDENCIAS, usados)), resumen)
+    elif not resultados:
+        libro.create_sheet(nombre_hoja_excel(HOJA_SIN_COINCIDENCIAS, usados)).append(["No se encontraron coincidencias."])
+    for clave, df_res in resultados.items():
+        escribir_hoja_streaming(libro.create_sheet(nombre_hoja_excel(clave, usados)), df_res)
+    libro.save(destino)
@@ -0,0 +1,78 @@
+"""Caché de búsquedas individuales: se invalida al cambiar la versión de los datos."""
+import numpy as np
+import pandas as pd
+
+import motor_nomina
+
+
+def buscador(datos, llamadas):
+    """buscar() que devuelve lo que haya en `datos` en ese momento y cuenta sus llamadas."""
+    def buscar():
+        llamadas.append(1)
+        return {"HOJA": pd.DataFrame({"RFC": [datos["rfc"]]})}
+    return buscar
+
+
+def test_clave_iguala_busquedas_equivalentes():
+    assert (motor_nomina.clave_busqueda(1, {"rfc": " abc123 ", "NOMBRE": ""})
+            == motor_nomina.clave_busqueda(1, {"R.F.C.": "ABC123"}))
+    assert motor_nomina.clave_busqueda(1, {"RFC": "ABC123"}) != motor_nomina.clave_busqueda(2, {"RFC": "ABC123"})
+
+
+def test_version_nueva_vacia_la_cache():
+    cache = motor_nomina.nueva_cache_resultados()
+    datos, llamadas = {"rfc": "VIEJO"}, []
+    buscar = buscador(datos, llamadas)
+
+    motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(1, {"RFC": "X"}), buscar)
+    resultado = motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(1, {"RFC": "X"}), buscar)
+    assert resultado["HOJA"]["RFC"].tolist() == ["VIEJO"] and len(llamadas) == 1
+
+    datos["rfc"] = "NUEVO"  # se recargaron los libros: versión 2
+    medicion = motor_nomina.nueva_medicion("busqueda")
+    resultado = motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(2, {"RFC": "X"}), buscar, medicion)
+    assert resultado["HOJA"]["RFC"].tolist() == ["NUEVO"] and len(llamadas) == 2
+    assert medicion["cache"] == "fallo"
+    estadisticas = motor_nomina.estadisticas_cache(cache)
+    assert (estadisticas["entradas"], estadisticas["invalidaciones"]) == (1, 1)
+    assert (estadisticas["aciertos"], estadisticas["fallos"]) == (1, 2)
+
+
+def test_version_anterior_no_entra_en_la_cache():
+    cache = motor_nomina.nueva_cache_resultados()
+    datos, llamadas = {"rfc": "NUEVO"}, []
+    buscar = buscador(datos, llamadas)
+    motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(2, {"RFC": "X"}), buscar)
+
+    # Una sesión que aún tiene el conjunto anterior busca sin leer ni ensuciar la caché
+    datos["rfc"] = "VIEJO"
+    resultado = motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(1, {"RFC": "X"}), buscar)
+    assert resultado["HOJA"]["RFC"].tolist() == ["VIEJO"] and len(llamadas) == 2
+    resultado = motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(2, {"RFC": "X"}), buscar)
+    assert resultado["HOJA"]["RFC"].tolist() == ["NUEVO"] and len(llamadas) == 2
+    assert motor_nomina.estadisticas_cache(cache)["invalidaciones"] == 0
+
+
+def hoja_con_categorias(n=50_000):
+    return pd.DataFrame({"RFC": pd.Series([f"RFC{i:06d}" for i in range(n)], dtype="category"),
+                         "NOMINA": pd.Series(np.where(np.arange(n) % 2, "ORDINARIA", "EXTRAORDINARIA"),
+                                             dtype="category"),
+                         "IMPORTE": np.arange(n, dtype=np.float32)})
+
+
+def test_resultado_pequeno_cuenta_poco():
+    hoja = hoja_con_categorias()
+    recorte = {"HOJA": hoja.iloc[[10, 20, 30]]}
+    assert motor_nomina.memoria_libro(recorte) > 1024**2  # memory_usage suma las 50 000 categorías
+    assert motor_nomina.memoria_resultados(recorte) < 1024
+    assert motor_nomina.memoria_resultados({"HOJA": hoja}) < motor_nomina.memoria_libro({"HOJA": hoja})
+
+
+def test_cache_guarda_muchos_resultados_pequenos():
+    hoja = hoja_con_categorias()
+    cache = motor_nomina.nueva_cache_resultados(max_bytes=64 * 1024)
+    for i in range(100):
+        motor_nomina.buscar_con_cache(cache, motor_nomina.clave_busqueda(1, {"RFC": f"RFC{i:06d}"}),
+                                      lambda i=i: {"HOJA": hoja.iloc[[i]]})
+    estadisticas = motor_nomina.estadisticas_cache(cache)
+    assert (estadisticas["entradas"], estadisticas["descartes"]) == (100, 0)
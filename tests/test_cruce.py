@@ -0,0 +1,64 @@
+"""Cruce de la plantilla masiva por hash join contra la búsqueda fila por fila original."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_nomina
+
+
+def cruce_fila_por_fila(df_busqueda_norm, df_hoja_norm):
+    """El ciclo con iterrows de la versión original: por cada fila de plantilla, en orden,
+    las filas de la hoja que igualan todas sus columnas llenas, en el orden de la hoja."""
+    posiciones = []
+    for _, fila_busq in df_busqueda_norm.iterrows():
+        mask = np.ones(len(df_hoja_norm), dtype=bool)
+        for col in df_busqueda_norm.columns:
+            val = fila_busq[col]
+            if val != "":
+                if col in df_hoja_norm.columns:
+                    mask &= (df_hoja_norm[col] == val).to_numpy()
+                else:
+                    mask &= False
+        posiciones.extend(np.flatnonzero(mask))
+    return np.array(posiciones, dtype=np.int64)
+
+
+@pytest.fixture
+def hoja():
+    rng = np.random.default_rng(7)
+    n = 600
+    df = pd.DataFrame({
+        "RFC": [f"rfc{i % 150:04d}" for i in range(n)],  # repetido -> category
+        "NOMBRE": [f" Nombre {i} " if i % 11 else None for i in range(n)],  # casi único -> Arrow
+        "NOMINA": rng.choice(["ordinaria", "Extraordinaria ", "ORDINARIA", None], n),
+        "CUENTA": rng.integers(0, 40, n),
+    })
+    return motor_nomina.normalizar_hoja(motor_nomina.optimizar_tipos(df))
+
+
+@pytest.fixture
+def plantilla():
+    df = pd.DataFrame({
+        "RFC": ["RFC0003", "rfc0003", "", "RFC0010", "RFC9999", "", "rfc0020", ""],
+        "NOMBRE": ["", "", "nombre 5", "", "", "", "", ""],
+        "NOMINA": ["", "ordinaria", "", "", "", "extraordinaria", "", ""],
+        "CUENTA": ["", "", "", "", "", "7", "", ""],
+        "ASUNTO": ["", "", "", "", "", "", "alta", ""],  # no existe en la hoja
+    })
+    return motor_nomina.normalizar_hoja(df)
+
+
+def test_hash_join_igual_al_ciclo_fila_por_fila(hoja, plantilla):
+    esperado = cruce_fila_por_fila(plantilla, hoja)
+    grupos = motor_nomina.agrupar_plantilla(plantilla)
+    filas, ordenes = motor_nomina.cruzar_plantilla_hoja(plantilla, grupos, hoja, devolver_orden=True)
+    assert filas.tolist() == esperado.tolist()
+    assert (np.diff(ordenes) >= 0).all()
+
+
+@pytest.mark.parametrize("max_filas", [1, 5, 37, 650])
+def test_hash_join_con_tope_toma_los_primeros_pares(hoja, plantilla, max_filas):
+    esperado = cruce_fila_por_fila(plantilla, hoja)[:max_filas]
+    grupos = motor_nomina.agrupar_plantilla(plantilla)
+    filas = motor_nomina.cruzar_plantilla_hoja(plantilla, grupos, hoja, max_filas=max_filas)
+    assert filas.tolist() == esperado.tolist()
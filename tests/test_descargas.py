@@ -0,0 +1,128 @@
+"""Descargas de Drive contra un servidor HTTP local que hace de Google Drive."""
+import functools
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import motor_nomina
+
+
+def iniciar_servidor(tmp_path, validadores=True):
+    """Sirve `tmp_path / "drive"` por HTTP y cuenta las peticiones; con `validadores` manda
+    Last-Modified y contesta 304, sin ellos nunca manda ETag ni Last-Modified."""
+    origen = tmp_path / "drive"
+    origen.mkdir()
+    peticiones = []
+
+    class Manejador(http.server.SimpleHTTPRequestHandler):
+        def do_GET(self):
+            peticiones.append((self.path, self.headers.get("If-Modified-Since")))
+            super().do_GET()
+
+        def send_header(self, clave, valor):
+            if validadores or clave not in ("Last-Modified", "ETag"):
+                super().send_header(clave, valor)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                            functools.partial(Manejador, directory=str(origen)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, (origen, f"http://127.0.0.1:{httpd.server_address[1]}", peticiones)
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    """Servidor que hace de Google Drive: con Last-Modified y 304."""
+    httpd, datos = iniciar_servidor(tmp_path)
+    yield datos
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def servidor_sin_validadores(tmp_path):
+    """Servidor que no manda ETag ni Last-Modified."""
+    httpd, datos = iniciar_servidor(tmp_path, validadores=False)
+    yield datos
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def publicar(origen, nombre, contenido):
+    (origen / nombre).write_bytes(contenido)
+
+
+def test_faltantes_se_descargan_y_luego_dan_304(servidor, tmp_path):
+    origen, base, peticiones = servidor
+    publicar(origen, "a.xlsx", b"A" * 4096)
+    carpeta = tmp_path / "local"
+    carpeta.mkdir()
+    urls = {"a.xlsx": f"{base}/a.xlsx"}
+
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta)) == {"a.xlsx": ("descargado", "")}
+    assert (carpeta / "a.xlsx").read_bytes() == b"A" * 4096
+    manifiesto = json.loads((carpeta / ".descargas.json").read_text(encoding="utf-8"))
+    assert manifiesto["a.xlsx"]["last_modified"]
+
+    resultado = motor_nomina.descargar_archivos_drive(urls, str(carpeta), solo_existentes=True)
+    assert resultado == {"a.xlsx": ("sin_cambios", "")}
+    assert len(peticiones) == 2 and peticiones[1][1] is not None
+
+
+def test_existente_sin_manifiesto_solo_se_baja_con_forzar(servidor, tmp_path):
+    origen, base, peticiones = servidor
+    publicar(origen, "f0.xlsx", b"N" * 4096)
+    carpeta = tmp_path / "local"
+    carpeta.mkdir()
+    (carpeta / "f0.xlsx").write_bytes(b"V" * 4096)  # instalación previa, sin .descargas.json
+    urls = {"f0.xlsx": f"{base}/f0.xlsx"}
+
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta)) == {}
+    assert peticiones == []
+
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta), forzar=True) == {"f0.xlsx": ("descargado", "")}
+    assert (carpeta / "f0.xlsx").read_bytes() == b"N" * 4096
+    assert peticiones[0][1] is None  # petición incondicional
+
+    # Con los validadores ya guardados la revisión es condicional
+    resultado = motor_nomina.descargar_archivos_drive(urls, str(carpeta), forzar=True)
+    assert resultado == {"f0.xlsx": ("sin_cambios", "")}
+    assert len(peticiones) == 2 and peticiones[1][1] is not None
+
+
+def test_respuesta_corrupta_no_reemplaza_el_archivo(servidor, tmp_path):
+    origen, base, _ = servidor
+    publicar(origen, "c.xlsx", b"x" * 10)
+    carpeta = tmp_path / "local"
+    carpeta.mkdir()
+    (carpeta / "c.xlsx").write_bytes(b"V" * 4096)
+
+    estado, _ = motor_nomina.descargar_archivos_drive({"c.xlsx": f"{base}/c.xlsx"}, str(carpeta), forzar=True)["c.xlsx"]
+    assert estado == "error"
+    assert (carpeta / "c.xlsx").read_bytes() == b"V" * 4096
+    assert [n for n in os.listdir(carpeta) if n.endswith(".part")] == []
+
+
+def test_sin_validadores_no_se_vuelve_a_bajar(servidor_sin_validadores, tmp_path):
+    origen, base, peticiones = servidor_sin_validadores
+    publicar(origen, "s.xlsx", b"S" * 4096)
+    carpeta = tmp_path / "local"
+    carpeta.mkdir()
+    urls = {"s.xlsx": f"{base}/s.xlsx"}
+
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta)) == {"s.xlsx": ("descargado", "")}
+    # Como en cada arranque de la app: el archivo ya existe y no hay con qué preguntar por cambios
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta), solo_existentes=True) == {}
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta)) == {}
+    assert len(peticiones) == 1
+
+    # Un manifiesto de una versión anterior con la entrada vacía tampoco provoca descargas
+    (carpeta / ".descargas.json").write_text(json.dumps({"s.xlsx": {"url": urls["s.xlsx"], "etag": None,
+                                                                    "last_modified": None}}), encoding="utf-8")
+    assert motor_nomina.descargar_archivos_drive(urls, str(carpeta), solo_existentes=True) == {}
+    assert len(peticiones) == 1
@@ -0,0 +1,24 @@
+"""Puntaje de nombres aproximados."""
+import motor_nomina
+
+
+def puntaje(consulta, candidato, parcial=True, memo=None):
+    return motor_nomina.puntaje_nombre(motor_nomina.forma_nombre(consulta), motor_nomina.forma_nombre(candidato),
+                                       parcial, motor_nomina.UMBRAL_DIFUSO, memo)
+
+
+def test_parcial_exige_cada_palabra():
+    # HERNANDEZ es exacto, pero GARCIA contra MARIA no llega al umbral
+    assert puntaje("HERNANDEZ GARCIA", "CANDIA HERNÁNDEZ LAURA MARÍA") == 0.0
+
+
+def test_parcial_tolera_acentos_errores_y_orden():
+    assert puntaje("hernandez garcia", "GARCÍA HERNÁNDEZ LAURA") == 1.0
+    assert puntaje("HERNANDEZ GARCIA", "GARSIA HERNADEZ LAURA") >= motor_nomina.UMBRAL_DIFUSO
+
+
+def test_memo_de_palabras_no_cambia_el_puntaje():
+    memo = {}
+    for candidato in ["GARSIA HERNADEZ LAURA", "CANDIA HERNÁNDEZ LAURA MARÍA", "GARCÍA HERNÁNDEZ LAURA"]:
+        assert puntaje("HERNANDEZ GARCIA", candidato, memo=memo) == puntaje("HERNANDEZ GARCIA", candidato)
+    assert memo[("palabras",)]
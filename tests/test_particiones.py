@@ -0,0 +1,63 @@
+"""Búsqueda masiva repartida por particiones (hoja, bloque de filas): mismos resultados que en serie."""
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_nomina
+
+
+def hoja_sintetica(semilla, n):
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({"RFC": [f"RFC{i:04d}" for i in rng.integers(0, 300, n)],
+                         "NOMBRE": [f"NOMBRE {i}" for i in rng.integers(0, 2000, n)],
+                         "NOMINA": rng.choice(["ORDINARIA", "EXTRAORDINARIA"], n),
+                         "IMPORTE": rng.integers(100, 900, n).astype(float)})
+
+
+@pytest.fixture
+def conjunto(tmp_path):
+    libros = {"CONTROL": {"NOMINA ACTUAL": hoja_sintetica(1, 2500)},
+              "HISTORICO": {"2023": hoja_sintetica(2, 4100), "2024": hoja_sintetica(3, 900)}}
+    libros = {libro: {hoja: motor_nomina.optimizar_tipos(df) for hoja, df in hojas.items()}
+              for libro, hojas in libros.items()}
+    return {"libros": libros,
+            "normalizados": {libro: {hoja: motor_nomina.normalizar_hoja(df) for hoja, df in hojas.items()}
+                             for libro, hojas in libros.items()},
+            "plan": {libro: {hoja: motor_nomina.planificar_hoja(df) for hoja, df in hojas.items()}
+                     for libro, hojas in libros.items()},
+            "huellas": {libro: {hoja: f"{libro}-{hoja}" for hoja in hojas} for libro, hojas in libros.items()},
+            "carpeta": str(tmp_path)}
+
+
+@pytest.fixture
+def plantilla():
+    return pd.DataFrame({"RFC": [f"RFC{i:04d}" for i in range(0, 300, 7)] + ["", "XXXX000000000", ""],
+                         "NOMBRE": [""] * 43 + ["nombre 15", "", ""],
+                         "NOMINA": [""] * 45 + ["ordinaria"]})
+
+
+def buscar(conjunto, plantilla, procesos, max_coincidencias=None):
+    encontradas, medicion = set(), motor_nomina.nueva_medicion("busqueda_masiva")
+    resultados = motor_nomina.buscar_masivo_todos_libros(
+        conjunto["libros"], plantilla, normalizados=conjunto["normalizados"], plan=conjunto["plan"],
+        max_coincidencias=max_coincidencias, encontradas=encontradas, procesos=procesos,
+        huellas=conjunto["huellas"], carpeta=conjunto["carpeta"], medicion=medicion)
+    return resultados, encontradas, medicion
+
+
+@pytest.mark.parametrize("max_coincidencias", [None, 25, 1000])
+def test_particiones_igual_que_en_serie(conjunto, plantilla, monkeypatch, caplog, max_coincidencias):
+    monkeypatch.setattr(motor_nomina, "MIN_FILAS_PARALELO", 0)
+    monkeypatch.setattr(motor_nomina, "FILAS_POR_PARTICION", 700)  # varias particiones, la última incompleta
+    serie, encontradas_serie, _ = buscar(conjunto, plantilla, 1, max_coincidencias)
+    with caplog.at_level(logging.WARNING, logger=motor_nomina.log.name):
+        paralelo, encontradas_paralelo, medicion = buscar(conjunto, plantilla, 2, max_coincidencias)
+
+    assert medicion.get("procesos") == 2
+    assert not [r for r in caplog.records if "en serie" in r.getMessage()]  # no hubo respaldo en serie
+    assert list(paralelo) == list(serie) and serie
+    for clave in serie:
+        pd.testing.assert_frame_equal(paralelo[clave], serie[clave])
+    assert encontradas_paralelo == encontradas_serie
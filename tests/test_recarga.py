@@ -0,0 +1,97 @@
+"""Recarga incremental del conjunto: reutilizar hojas sin cambios da lo mismo que releer todo."""
+import os
+import shutil
+import stat
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import motor_nomina
+
+
+def escribir_libro(ruta, hojas):
+    libro = openpyxl.Workbook()
+    libro.remove(libro.active)
+    for nombre, filas in hojas.items():
+        hoja = libro.create_sheet(nombre)
+        for fila in filas:
+            hoja.append(fila)
+    libro.save(ruta)
+
+
+def filas_hoja(semilla, n=40):
+    rng = np.random.default_rng(semilla)
+    filas = [["RFC", "NOMBRE", "NOMINA", "IMPORTE"]]
+    for i in range(n):
+        filas.append([f"RFC{rng.integers(0, 15):04d}", f"Nombre {semilla} {i}",
+                      str(rng.choice(["ORDINARIA", "EXTRAORDINARIA"])), float(rng.integers(100, 900))])
+    return filas
+
+
+@pytest.fixture
+def carpeta(tmp_path):
+    for n, archivo in enumerate(motor_nomina.ARCHIVOS_LIBROS.values()):
+        escribir_libro(tmp_path / archivo, {f"H{n}A": filas_hoja(10 * n), f"H{n}B": filas_hoja(10 * n + 1)})
+    return tmp_path
+
+
+def assert_conjuntos_iguales(a, b):
+    for clave in ("libros", "normalizados"):
+        assert list(a[clave]) == list(b[clave])
+        for libro in a[clave]:
+            assert list(a[clave][libro]) == list(b[clave][libro])
+            for hoja in a[clave][libro]:
+                pd.testing.assert_frame_equal(a[clave][libro][hoja], b[clave][libro][hoja])
+    assert a["plan"] == b["plan"]
+    for libro, indices in a["indices"].items():
+        assert list(indices["hojas"]) == list(b["indices"][libro]["hojas"])
+        for hoja, columnas in indices["hojas"].items():
+            for columna, indice in columnas.items():
+                otro = b["indices"][libro]["hojas"][hoja][columna]
+                assert (indice["codigos"] == otro["codigos"]).all()
+                assert list(indice["valores"]) == list(otro["valores"])
+
+
+def test_recarga_incremental_igual_a_releer_todo(carpeta):
+    anterior = motor_nomina.construir_conjunto(str(carpeta), 1, max_procesos=1)
+
+    ruta = carpeta / motor_nomina.ARCHIVOS_LIBROS["HISTORICO"]
+    libro = openpyxl.load_workbook(ruta)
+    libro["H1B"]["B5"] = "NOMBRE CAMBIADO"
+    libro.create_sheet("H1C").append(["RFC", "NOMBRE"])
+    libro["H1C"].append(["RFC0001", "HOJA NUEVA"])
+    libro.save(ruta)
+
+    incremental = motor_nomina.construir_conjunto(str(carpeta), 2, max_procesos=1, anterior=anterior)
+    releidas = [(h["libro"], h["hoja"]) for h in incremental["medicion"]["hojas"] if not h["reutilizada"]]
+    assert releidas == [("HISTORICO", "H1B"), ("HISTORICO", "H1C")]
+    assert incremental["libros"]["HISTORICO"]["H1B"].iloc[3]["NOMBRE"] == "NOMBRE CAMBIADO"
+
+    shutil.rmtree(carpeta / ".cache_columnar")
+    completo = motor_nomina.construir_conjunto(str(carpeta), 3, max_procesos=1)
+    assert completo["medicion"]["hojas_reutilizadas"] == 0
+    assert_conjuntos_iguales(incremental, completo)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="permisos POSIX")
+def test_cache_privada_y_respeta_temporales_ajenos(carpeta):
+    ruta = carpeta / motor_nomina.ARCHIVOS_LIBROS["CONTROL"]
+    dir_cache = carpeta / ".cache_columnar" / ruta.name
+    dir_cache.mkdir(parents=True)
+    ajeno = dir_cache / "hoja_abc.arrow.999.1.tmp"  # otro proceso escribiendo la misma caché
+    abandonado = dir_cache / "manifiesto.json.998.1.tmp"
+    ajeno.write_bytes(b"x")
+    abandonado.write_bytes(b"x")
+    viejo = time.time() - (motor_nomina.HORAS_TEMPORALES + 1) * 3600
+    os.utime(abandonado, (viejo, viejo))
+
+    motor_nomina.cargar_datos(str(ruta))
+
+    assert ajeno.exists() and not abandonado.exists()
+    assert stat.S_IMODE(dir_cache.stat().st_mode) == 0o700
+    guardados = [a for a in dir_cache.iterdir() if a != ajeno]
+    assert {a.name for a in guardados} >= {"manifiesto.json"} and len(guardados) == 3
+    assert all(stat.S_IMODE(a.stat().st_mode) == 0o600 for a in guardados)
@@ -0,0 +1,57 @@
+"""Tipos compactos y copia normalizada: el texto que se compara no cambia respecto a la hoja original."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_nomina
+
+
+def a_mayusculas(df):
+    """Lo que comparaba la versión original: la hoja completa a texto limpio en mayúsculas."""
+    return df.fillna("").astype(str).map(lambda x: x.strip().upper())
+
+
+@pytest.fixture
+def hoja():
+    rng = np.random.default_rng(3)
+    n = 400
+    return pd.DataFrame({
+        "NOMINA": rng.choice(["ordinaria", " ORDINARIA", "Ordinaria ", "EXTRA", None], n),  # category que se une
+        "NOMBRE": [f" Nombre {i} " for i in range(n)],  # texto único -> Arrow
+        "MIXTA": [[1, "a", 2.5, None, pd.Timestamp("2024-01-31"), True][i % 6] for i in range(n)],
+        "VACIA": np.full(n, np.nan),
+        "IMPORTE": rng.choice([0.1, 1.5, 100.0, 1e20, 3.14159, np.nan], n),  # 0.1 no cabe en float32
+        "MITADES": rng.choice([0.5, 2.25, -7.0, np.nan], n),  # sí cabe en float32
+        "CUENTA": rng.integers(-3, 2**40, n),
+        "QUINCENA": rng.integers(1, 25, n),
+        "FECHA": pd.to_datetime("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        "RFC_CON_NUMEROS": [f"RFC{i % 9}" if i % 4 else i for i in range(n)],
+    })
+
+
+def test_normalizada_igual_al_texto_original(hoja):
+    optimizada = motor_nomina.optimizar_tipos(hoja)
+    normalizada = motor_nomina.normalizar_hoja(optimizada)
+    esperada = a_mayusculas(hoja)
+    assert list(normalizada.columns) == list(esperada.columns)
+    for col in esperada.columns:
+        assert normalizada[col].to_numpy(dtype=object).tolist() == esperada[col].tolist(), col
+
+
+def test_tipos_compactos_conservan_los_valores(hoja):
+    optimizada = motor_nomina.optimizar_tipos(hoja)
+    assert isinstance(optimizada["NOMINA"].dtype, pd.CategoricalDtype)
+    assert optimizada["NOMBRE"].dtype == pd.StringDtype("pyarrow")
+    assert optimizada["MITADES"].dtype == np.float32
+    assert optimizada["IMPORTE"].dtype == np.float64
+    assert optimizada["QUINCENA"].dtype == np.int8
+    assert optimizada["MIXTA"].dtype == object
+    for col in hoja.columns:
+        assert optimizada[col].astype(object).where(optimizada[col].notna(), None).tolist() == \
+            hoja[col].astype(object).where(hoja[col].notna(), None).tolist(), col
+
+
+def test_categorias_iguales_al_normalizar_se_unen(hoja):
+    normalizada = motor_nomina.normalizar_columna(hoja["NOMINA"].astype("category"))
+    assert sorted(normalizada.cat.categories) == ["", "EXTRA", "ORDINARIA"]
+    assert (normalizada == "ORDINARIA").sum() == hoja["NOMINA"].str.strip().str.upper().eq("ORDINARIA").sum()
@@ -0,0 +1,73 @@
+"""Prefiltro por trigramas contra el `str.contains` de la búsqueda individual original."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_nomina
+
+
+def a_mayusculas(df):
+    """La hoja completa a texto en mayúsculas, como en la versión original."""
+    return df.fillna("").astype(str).map(lambda x: x.strip().upper())
+
+
+def contiene_original(df_upper, criterios, max_coincidencias=None):
+    """La búsqueda de la versión original: un `str.contains` (con expresiones regulares) por criterio."""
+    mask = np.ones(len(df_upper), dtype=bool)
+    for col, val in criterios:
+        mask &= df_upper[col].str.contains(val, na=False).to_numpy()
+    return np.flatnonzero(mask)[:max_coincidencias]
+
+
+@pytest.fixture(scope="module")
+def hoja():
+    rng = np.random.default_rng(11)
+    n = 3000
+    apellidos = np.array(["PÉREZ", "perez", "LÓPEZ", "GARCÍA", "HERNÁNDEZ", "DÍAZ", "RUIZ", "O'BRIEN"])
+    nombres = [f" {a} {b} {i} " for i, (a, b) in enumerate(zip(rng.choice(apellidos, n), rng.choice(apellidos, n)))]
+    df = pd.DataFrame({
+        "RFC": [f"rfc{i % 400:04d}" if i % 37 else None for i in range(n)],  # repetido -> category
+        "NOMBRE": nombres,  # único -> Arrow
+        "ADSCRIPCION": rng.choice(["Xalapa", "POZA RICA", "Veracruz (Puerto)", "A.B.C"], n),
+        "CUENTA": rng.integers(0, 5000, n),
+        "NOMINA": rng.choice(["ORDINARIA", "EXTRAORDINARIA"], n),  # sin índice
+    })
+    df_norm = motor_nomina.normalizar_hoja(motor_nomina.optimizar_tipos(df))
+    indices = motor_nomina.construir_indices_libro({"H": df_norm})["hojas"]["H"]
+    return a_mayusculas(df), df_norm, indices
+
+
+CRITERIOS = [
+    [("RFC", "RFC001")],
+    [("RFC", "FC0")],
+    [("NOMBRE", "PÉREZ")],
+    [("NOMBRE", "PEREZ 1")],
+    [("NOMBRE", "Z")],  # menos de tres caracteres: sin índice
+    [("NOMBRE", "UI")],
+    [("NOMBRE", "O'BRIEN")],
+    [("ADSCRIPCION", "A.B"), ("NOMBRE", "DÍAZ")],  # el punto es comodín de regex
+    [("ADSCRIPCION", "^POZA")],
+    [("ADSCRIPCION", "RUZ|LAPA")],
+    [("ADSCRIPCION", "(PUERTO)")],
+    [("CUENTA", "12")],
+    [("CUENTA", "4999")],
+    [("NOMINA", "EXTRA"), ("RFC", "RFC00")],
+    [("RFC", "NOEXISTE")],
+    [("NOMBRE", "LÓPEZ"), ("ADSCRIPCION", "XALAPA"), ("NOMINA", "ORD")],
+]
+
+
+@pytest.mark.filterwarnings("ignore:This pattern is interpreted as a regular expression")
+@pytest.mark.parametrize("criterios", CRITERIOS, ids=lambda c: "+".join(v for _, v in c))
+@pytest.mark.parametrize("max_coincidencias", [None, 1, 7])
+def test_trigramas_igual_que_str_contains(hoja, criterios, max_coincidencias):
+    df_upper, df_norm, indices = hoja
+    filas = motor_nomina.filas_coincidentes(df_norm, indices, criterios, max_coincidencias)
+    assert filas.tolist() == contiene_original(df_upper, criterios, max_coincidencias).tolist()
+
+
+def test_el_indice_cubre_las_columnas_de_ambos_tipos(hoja):
+    _, df_norm, indices = hoja
+    assert {"RFC", "NOMBRE", "ADSCRIPCION", "CUENTA"} <= set(indices)
+    assert isinstance(df_norm["RFC"].dtype, pd.CategoricalDtype)
+    assert df_norm["NOMBRE"].dtype == pd.StringDtype("pyarrow")